@@ -0,0 +1,74 @@
+"""
+Load test: N concurrent clients against a running API.
+
+Usage:
+    uvicorn backend.main:app --port 8000 &
+    python -m backend.benchmarks.bench_api_load --base-url http://localhost:8000 --clients 200 --seconds 20
+
+Each client loops over a mix of read endpoints (run list, run details, leads,
+config) plus POST /api/execute, so both the read path and the write-and-dispatch
+path are exercised. Run once before and once after a change to compare.
+Requires httpx.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+
+async def client_loop(client, base_url, run_ids, deadline, latencies, errors, include_writes):
+    while time.perf_counter() < deadline:
+        choice = random.random()
+        if run_ids and choice < 0.35:
+            req = client.get(f"{base_url}/api/runs/{random.choice(run_ids)}?limit=100")
+        elif choice < 0.6:
+            req = client.get(f"{base_url}/api/runs?limit=50")
+        elif run_ids and choice < 0.75:
+            req = client.get(f"{base_url}/api/runs/{random.choice(run_ids)}/leads")
+        elif choice < 0.9 or not include_writes:
+            req = client.get(f"{base_url}/api/config/bench@example.com")
+        else:
+            req = client.post(f"{base_url}/api/execute", json={"script_name": "check_api_keys.py", "args": []})
+        start = time.perf_counter()
+        try:
+            resp = await req
+            if resp.status_code >= 500:
+                errors.append(resp.status_code)
+        except Exception as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--no-writes", action="store_true", help="Skip POST /api/execute")
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        runs = (await client.get(f"{args.base_url}/api/runs?limit=50")).json().get("runs", [])
+        run_ids = [r["run_id"] for r in runs]
+
+        latencies, errors = [], []
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(*[
+            client_loop(client, args.base_url, run_ids, deadline, latencies, errors, not args.no_writes)
+            for _ in range(args.clients)
+        ])
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+    print(f"Clients: {args.clients} | Duration: {args.seconds}s | Requests: {len(latencies)} | Errors: {len(errors)}")
+    print(f"  throughput {len(latencies) / args.seconds:8.1f} req/s")
+    print(f"  latency    p50 {pct(50):7.1f} ms  p95 {pct(95):7.1f} ms  p99 {pct(99):7.1f} ms  "
+          f"mean {statistics.mean(latencies) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Benchmark: job startup latency, fresh `python3 -u` subprocess vs warm fork server.
+
+Usage:
+    python -m backend.benchmarks.bench_executor --runs 10
+
+Each job is a tiny script that imports the same heavy modules the execution
+scripts use (whichever are installed) and prints one line. Reported times are
+spawn -> first output line, and spawn -> exit.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+from backend import executor
+
+JOB_SCRIPT = '''
+import importlib
+for name in {modules!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+print("ready", flush=True)
+'''
+
+
+def time_job(script_path, mode):
+    start = time.perf_counter()
+    process = executor.start_script(script_path, [], dict(os.environ), mode=mode)
+    process.stdout.readline()
+    first_line = time.perf_counter() - start
+    for _ in iter(process.stdout.readline, ''):
+        pass
+    returncode = process.wait()
+    assert returncode == 0, f"{mode} job exited with {returncode}"
+    return first_line, time.perf_counter() - start
+
+
+def report(label, samples):
+    first = [s[0] * 1000 for s in samples]
+    total = [s[1] * 1000 for s in samples]
+    print(f"  {label:<11} first line p50 {statistics.median(first):8.1f} ms  max {max(first):8.1f} ms | "
+          f"exit p50 {statistics.median(total):8.1f} ms")
+    return statistics.median(total)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    installed = []
+    for name in executor.PRELOAD_MODULES:
+        try:
+            __import__(name)
+            installed.append(name)
+        except ImportError:
+            pass
+    print(f"Job imports: {', '.join(installed) or '(none installed)'}")
+
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+        f.write(JOB_SCRIPT.format(modules=executor.PRELOAD_MODULES))
+        script_path = f.name
+
+    try:
+        # Warm-up is a one-off per worker process, so keep it out of the samples
+        start = time.perf_counter()
+        executor.EXECUTOR_MODE = "forkserver"
+        executor.warm_up()
+        print(f"Fork server warm-up: {(time.perf_counter() - start) * 1000:.1f} ms (once per worker)")
+
+        cold = [time_job(script_path, "subprocess") for _ in range(args.runs)]
+        warm = [time_job(script_path, "forkserver") for _ in range(args.runs)]
+
+        t_cold = report("subprocess", cold)
+        t_warm = report("forkserver", warm)
+        print(f"  speedup     {t_cold / t_warm:.1f}x")
+    finally:
+        os.remove(script_path)
+
+
+if __name__ == "__main__":
+    main()
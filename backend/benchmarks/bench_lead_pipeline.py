@@ -0,0 +1,113 @@
+"""
+fetch_and_enrich_leads against stub Apollo / Blitz servers with realistic latency.
+
+Usage:
+    python -m backend.benchmarks.bench_lead_pipeline --limit 300 --apollo-latency 1.0 --blitz-latency 0.05
+
+Starts two local HTTP servers: a paged people search (100 per page, a few
+people repeated across pages) and an email lookup that finds an email for
+--hit-rate of profiles. Points the orchestrator at them and reports total
+time, time to the first verified lead, and how many calls each side served.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+PER_PAGE = 100
+# Every page repeats a few people of the previous page (Apollo does this across pages)
+OVERLAP = 5
+
+
+def make_handler(apollo_latency, blitz_latency, hit_rate, calls):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.startswith("/apollo"):
+                calls["apollo"] += 1
+                time.sleep(apollo_latency)
+                page = body.get("page", 1)
+                first = (page - 1) * PER_PAGE - (OVERLAP if page > 1 else 0)
+                people = [{
+                    "id": f"person-{i}",
+                    "first_name": f"First{i}",
+                    "last_name": f"Last{i}",
+                    "title": "Founder",
+                    "linkedin_url": f"https://linkedin.com/in/person-{i}",
+                    "organization": {"name": f"Company {i}"},
+                } for i in range(first, first + PER_PAGE)]
+                payload = {"people": people}
+            else:
+                calls["blitz"] += 1
+                time.sleep(blitz_latency)
+                url = body.get("linkedin_profile_url", "")
+                found = int(hashlib.md5(url.encode()).hexdigest(), 16) % 1000 < hit_rate * 1000
+                payload = {"work_email": f"{url.rsplit('/', 1)[-1]}@example.com" if found else None}
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=300)
+    parser.add_argument("--apollo-latency", type=float, default=1.0, help="seconds per search page")
+    parser.add_argument("--blitz-latency", type=float, default=0.05, help="seconds per email lookup")
+    parser.add_argument("--hit-rate", type=float, default=0.5, help="share of profiles with an email")
+    args = parser.parse_args()
+
+    calls = {"apollo": 0, "blitz": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                 make_handler(args.apollo_latency, args.blitz_latency, args.hit_rate, calls))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    # No Apollo page cache, no DB: measure the pipeline only
+    os.environ.pop("REDIS_URL", None)
+    from execution import lead_gen_orchestrator as orchestrator
+    orchestrator.APOLLO_API_URL = f"{base}/apollo"
+    orchestrator.BLITZ_API_URL = f"{base}/blitz"
+    orchestrator.APOLLO_API_KEY = "bench"
+    orchestrator.BLITZ_API_KEY = "bench"
+
+    first_verified = []
+    start = time.perf_counter()
+
+    def on_verified(lead):
+        if not first_verified:
+            first_verified.append(time.perf_counter() - start)
+
+    apollo_url = "https://app.apollo.io/#/people?personTitles[]=founder"
+    leads = orchestrator.fetch_and_enrich_leads(apollo_url, limit=args.limit, on_verified=on_verified)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    ids = [lead.get("id") for lead in leads]
+    print(f"\nLimit: {args.limit} | Apollo {args.apollo_latency}s/page | Blitz {args.blitz_latency}s/lookup "
+          f"| hit rate {args.hit_rate}")
+    print(f"  verified leads      : {len(leads)} ({len(set(ids))} unique)")
+    print(f"  total time          : {elapsed:8.2f}s")
+    print(f"  first verified lead : {first_verified[0] if first_verified else float('nan'):8.2f}s")
+    print(f"  apollo pages served : {calls['apollo']}")
+    print(f"  blitz lookups       : {calls['blitz']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Throughput of POST /api/logs (batched step events from backend.instrumentation).
+
+Usage:
+    uvicorn backend.main:app --port 8000 &
+    python -m backend.benchmarks.bench_log_ingest --base-url http://localhost:8000 --events 50000 --batch 500
+
+Registers a run, then --senders concurrent clients post --events events in
+batches of --batch. Every batch is posted twice (a retry), so the second
+pass also checks that ingestion is idempotent. Requires httpx.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+
+def make_batches(run_id, events, batch):
+    all_events = [{
+        "event_id": str(uuid.uuid4()),
+        "run_id": run_id,
+        "timestamp": "2026-01-01T00:00:00",
+        "event_type": "step_end",
+        "data": {"step_name": "bench", "i": i, "status": "success"},
+    } for i in range(events)]
+    return [all_events[i:i + batch] for i in range(0, events, batch)]
+
+
+async def post_all(client, url, batches, senders):
+    pending = list(batches)
+    totals = {"stored": 0, "duplicates": 0}
+
+    async def sender():
+        while pending:
+            resp = await client.post(url, json=pending.pop())
+            resp.raise_for_status()
+            body = resp.json()
+            totals["stored"] += body["stored"]
+            totals["duplicates"] += body["duplicates"]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(senders)))
+    return time.perf_counter() - start, totals
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--senders", type=int, default=4)
+    args = parser.parse_args()
+
+    run_id = f"bench_{uuid.uuid4()}"
+    async with httpx.AsyncClient(timeout=60) as client:
+        resp = await client.post(f"{args.base_url}/api/runs", json={"run_id": run_id, "script_name": "bench"})
+        resp.raise_for_status()
+        batches = make_batches(run_id, args.events, args.batch)
+        url = f"{args.base_url}/api/logs"
+
+        print(f"Events: {args.events} | Batch: {args.batch} | Senders: {args.senders}")
+        for label in ("first pass", "retry pass"):
+            elapsed, totals = await post_all(client, url, batches, args.senders)
+            print(f"  {label:10}: {elapsed:7.2f}s  {args.events / elapsed:10.0f} events/s  "
+                  f"stored={totals['stored']} duplicates={totals['duplicates']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,7 @@
 import os
 from celery import Celery
+from celery.signals import before_task_publish
+from kombu import Queue
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,6 +13,49 @@ if not REDIS_URL:
     print("WARNING: No REDIS_URL found. Defaulting to localhost (will fail in production).")
     REDIS_URL = "redis://localhost:6379/0"
 
+# --- Queues ---
+# interactive: previews, test runs, small jobs a user is actively waiting on
+# paid:        jobs a customer has paid for (Stripe checkout)
+# batch:       everything else (large scrapes, maintenance scripts)
+# Each queue gets its own worker in start.sh so a 10k-lead job can't block a 5-lead test.
+QUEUE_INTERACTIVE = "interactive"
+QUEUE_PAID = "paid"
+QUEUE_BATCH = "batch"
+
+# Scripts that are always quick enough to treat as interactive
+INTERACTIVE_SCRIPTS = {"check_api_keys.py", "check_latest_run_status.py"}
+# Lead jobs at or below this --limit are interactive
+INTERACTIVE_MAX_LIMIT = int(os.getenv("INTERACTIVE_MAX_LIMIT", "50"))
+
+
+def route_run_script(name, args, kwargs, options, task=None, **kw):
+    """
+    Picks a queue for run_script_task from the script and its arguments.
+    An explicit `queue=` passed to apply_async (e.g. QUEUE_PAID from the
+    Stripe webhook) takes precedence over this.
+    """
+    if name != "backend.tasks.run_script_task":
+        return None
+
+    kwargs = kwargs or {}
+    args = args or ()
+    script_name = kwargs.get("script_name") or (args[0] if len(args) > 0 else "")
+    script_args = kwargs.get("args") or (args[1] if len(args) > 1 else []) or []
+
+    if os.path.basename(script_name) in INTERACTIVE_SCRIPTS or "--mock" in script_args:
+        return {"queue": QUEUE_INTERACTIVE}
+
+    if "--limit" in script_args:
+        try:
+            limit = int(script_args[script_args.index("--limit") + 1])
+            if limit <= INTERACTIVE_MAX_LIMIT:
+                return {"queue": QUEUE_INTERACTIVE}
+        except (IndexError, ValueError):
+            pass
+
+    return {"queue": QUEUE_BATCH}
+
+
 celery_app = Celery(
     "sipes_automation_worker",
     broker=REDIS_URL,
@@ -23,4 +68,44 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    task_queues=(
+        Queue(QUEUE_INTERACTIVE),
+        Queue(QUEUE_PAID),
+        Queue(QUEUE_BATCH),
+    ),
+    task_default_queue=QUEUE_BATCH,
+    task_routes=(route_run_script,),
+    # Long-running jobs: don't let one worker process reserve work others could start
+    worker_prefetch_multiplier=1,
+    # Ack after the task returns, so a job whose worker host dies is redelivered
+    # (after visibility_timeout) instead of lost; run_script_task skips runs that
+    # already settled. No task_reject_on_worker_lost: a pool child killed mid-job
+    # (OOM, SIGKILL) must not requeue a paid job immediately; the reaper decides.
+    task_acks_late=True,
+    # Redis redelivers unacked tasks after this long; must exceed the longest
+    # job or it would be started twice. Dead workers are caught sooner by the
+    # heartbeat reaper below.
+    broker_transport_options={
+        "visibility_timeout": int(os.getenv("CELERY_VISIBILITY_TIMEOUT", str(12 * 3600))),
+    },
+    # Periodic maintenance (run by `celery beat`, see start.sh)
+    beat_schedule={
+        "compact-run-logs": {
+            "task": "backend.tasks.compact_run_logs_task",
+            "schedule": float(os.getenv("LOG_COMPACTION_INTERVAL", "3600")),
+        },
+        "reap-stalled-runs": {
+            "task": "backend.tasks.reap_stalled_runs_task",
+            "schedule": float(os.getenv("RUN_REAPER_INTERVAL", "60")),
+        },
+    },
 )
+
+
+@before_task_publish.connect
+def inject_trace_context(headers=None, **kwargs):
+    # Every .delay / apply_async made inside a trace carries it to the worker
+    from backend.tracing import current_traceparent
+    traceparent = current_traceparent()
+    if traceparent and headers is not None:
+        headers.setdefault("traceparent", traceparent)
@@ -0,0 +1,132 @@
+import json
+import os
+import time
+from typing import Optional
+
+import redis
+
+from backend.celery_app import REDIS_URL
+
+# Per-workspace cap on concurrently RUNNING jobs (WorkspaceConfig.max_concurrent_runs overrides)
+DEFAULT_MAX_CONCURRENT_RUNS = int(os.getenv("WORKSPACE_MAX_CONCURRENT_RUNS", "2"))
+# A slot is a lease: if a worker dies without releasing, the slot frees itself after this.
+SLOT_LEASE_SECONDS = int(os.getenv("WORKSPACE_SLOT_LEASE", str(6 * 3600)))
+# Waiting entries whose task never came back (e.g. revoked) are dropped after this.
+WAIT_TTL_SECONDS = int(os.getenv("WORKSPACE_WAIT_TTL", str(24 * 3600)))
+# How often a blocked run re-checks for a free slot
+RETRY_SECONDS = int(os.getenv("WORKSPACE_RETRY_SECONDS", "5"))
+# A waiter that hasn't re-checked for this long (its retry was lost, revoked or
+# expired) is dropped, so it can't hold up the runs behind it
+WAITER_STALE_SECONDS = int(os.getenv("WORKSPACE_WAITER_STALE", str(12 * RETRY_SECONDS)))
+
+# KEYS[1] = slots zset (member=run_id, score=lease expiry)
+# KEYS[2] = waiting zset (member=run_id, score=enqueue time, i.e. queue order)
+# KEYS[3] = seen zset (member=run_id, score=last attempt of a waiter)
+# ARGV    = run_id, limit, now, lease_expiry, wait_cutoff, seen_cutoff
+# Returns 1 if a slot was taken, otherwise -(1 + queue position).
+# FIFO: a run only takes a free slot if no earlier waiter could take it first.
+_ACQUIRE_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[5])
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 1
+end
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+for _, stale in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[6])) do
+    redis.call('ZREM', KEYS[2], stale)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', ARGV[6])
+if not redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+end
+local free = tonumber(ARGV[2]) - redis.call('ZCARD', KEYS[1])
+local rank = redis.call('ZRANK', KEYS[2], ARGV[1])
+if rank < free then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+    return 1
+end
+return -(1 + rank)
+"""
+
+_client = None
+_acquire_script = None
+
+
+def _get_client():
+    global _client, _acquire_script
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, decode_responses=True,
+                                       socket_connect_timeout=2, socket_timeout=2)
+        _acquire_script = _client.register_script(_ACQUIRE_LUA)
+    return _client
+
+
+def _slots_key(workspace_id: str) -> str:
+    return f"ws_slots:{workspace_id}"
+
+
+def _waiting_key(workspace_id: str) -> str:
+    return f"ws_waiting:{workspace_id}"
+
+
+def _seen_key(workspace_id: str) -> str:
+    return f"ws_waiting_seen:{workspace_id}"
+
+
+def workspace_for_args(args) -> Optional[str]:
+    """Runs belong to the workspace of their --email arg (WorkspaceConfig.workspace_id)."""
+    if isinstance(args, str):
+        try:
+            args = json.loads(args)
+        except Exception:
+            return None
+    if not isinstance(args, list) or "--email" not in args:
+        return None
+    try:
+        return args[args.index("--email") + 1]
+    except IndexError:
+        return None
+
+
+def acquire_slot(workspace_id: str, run_id: str, limit: int) -> int:
+    """
+    Tries to start `run_id` for the workspace. Returns 0 if a slot was taken,
+    otherwise the run's 1-based position in the workspace's waiting line.
+    Fails open (returns 0) if Redis is unreachable.
+    """
+    try:
+        _get_client()
+        now = time.time()
+        result = _acquire_script(
+            keys=[_slots_key(workspace_id), _waiting_key(workspace_id), _seen_key(workspace_id)],
+            args=[run_id, limit, now, now + SLOT_LEASE_SECONDS, now - WAIT_TTL_SECONDS,
+                  now - WAITER_STALE_SECONDS]
+        )
+        return 0 if int(result) == 1 else -int(result)
+    except Exception as e:
+        print(f"[Concurrency] Redis unavailable, not limiting {workspace_id}: {e}")
+        return 0
+
+
+def release_slot(workspace_id: str, run_id: str):
+    try:
+        client = _get_client()
+        pipe = client.pipeline()
+        pipe.zrem(_slots_key(workspace_id), run_id)
+        pipe.zrem(_waiting_key(workspace_id), run_id)
+        pipe.zrem(_seen_key(workspace_id), run_id)
+        pipe.execute()
+    except Exception as e:
+        print(f"[Concurrency] Failed to release slot for {run_id}: {e}")
+
+
+def queue_position(workspace_id: str, run_id: str) -> Optional[int]:
+    """1-based position among the workspace's waiting runs, or None if not waiting."""
+    try:
+        rank = _get_client().zrank(_waiting_key(workspace_id), run_id)
+        return None if rank is None else rank + 1
+    except Exception:
+        return None
+
@@ -0,0 +1,140 @@
+import threading
+import time
+from typing import Dict, Optional
+
+import redis
+from sqlalchemy import select
+
+from backend.celery_app import REDIS_URL
+from backend.models import WorkspaceConfig
+
+# WorkspaceConfig column -> env var handed to execution scripts
+CREDENTIAL_ENV_VARS = (
+    ("apollo_api_key", "APOLLO_API_KEY"),
+    ("blitz_api_key", "BLITZ_API_KEY"),
+    ("million_verifier_api_key", "MILLION_VERIFIER_API_KEY"),
+    ("smartlead_api_key", "SMARTLEAD_API_KEY"),
+)
+
+# Entries are dropped immediately on invalidation (POST /api/config publishes
+# on INVALIDATION_CHANNEL); the TTL only bounds staleness if a message is missed.
+CREDENTIALS_CACHE_TTL_SECONDS = 300
+INVALIDATION_CHANNEL = "workspace_config:invalidate"
+
+_cache: Dict[str, tuple] = {}          # workspace_id -> (expires_at, env_vars)
+_generations: Dict[str, int] = {}      # bumped on invalidation; stale loads are not stored
+_epoch = 0                             # bumped when everything is dropped (listener reconnect)
+_lock = threading.Lock()
+_listener: Optional[threading.Thread] = None
+
+
+def env_vars_for_config(config) -> Dict[str, str]:
+    env_vars = {}
+    if config:
+        for column, env_name in CREDENTIAL_ENV_VARS:
+            value = getattr(config, column, None)
+            if value:
+                env_vars[env_name] = value
+    return env_vars
+
+
+def _generation(workspace_id: str):
+    # Caller holds _lock
+    return _epoch, _generations.get(workspace_id, 0)
+
+
+def _cached(workspace_id: str):
+    """(hit, env_vars, generation)"""
+    _ensure_listener()
+    with _lock:
+        entry = _cache.get(workspace_id)
+        generation = _generation(workspace_id)
+    if entry and entry[0] > time.monotonic():
+        return True, dict(entry[1]), generation
+    return False, None, generation
+
+
+def _store(workspace_id: str, generation, env_vars: Dict[str, str]):
+    with _lock:
+        # An invalidation landed while we were reading the DB: don't cache the old value
+        if _generation(workspace_id) == generation:
+            _cache[workspace_id] = (time.monotonic() + CREDENTIALS_CACHE_TTL_SECONDS, env_vars)
+
+
+def _columns():
+    return [getattr(WorkspaceConfig, column) for column, _ in CREDENTIAL_ENV_VARS]
+
+
+def resolve_env_vars(db, workspace_id: str) -> Dict[str, str]:
+    """Env vars for a workspace's API keys (sync sessions)."""
+    hit, env_vars, generation = _cached(workspace_id)
+    if hit:
+        return env_vars
+    row = db.execute(select(*_columns()).where(WorkspaceConfig.workspace_id == workspace_id)).first()
+    env_vars = env_vars_for_config(row)
+    _store(workspace_id, generation, env_vars)
+    return dict(env_vars)
+
+
+async def resolve_env_vars_async(db, workspace_id: str) -> Dict[str, str]:
+    """Same as resolve_env_vars for an AsyncSession."""
+    hit, env_vars, generation = _cached(workspace_id)
+    if hit:
+        return env_vars
+    row = (await db.execute(select(*_columns()).where(WorkspaceConfig.workspace_id == workspace_id))).first()
+    env_vars = env_vars_for_config(row)
+    _store(workspace_id, generation, env_vars)
+    return dict(env_vars)
+
+
+def _drop(workspace_id: Optional[str]):
+    global _epoch
+    with _lock:
+        if workspace_id is None:
+            # Also covers loads in flight for workspaces that aren't cached yet
+            _epoch += 1
+            _generations.clear()
+            _cache.clear()
+        else:
+            _generations[workspace_id] = _generations.get(workspace_id, 0) + 1
+            _cache.pop(workspace_id, None)
+
+
+def invalidate_credentials(workspace_id: str):
+    """Drop the workspace locally and tell every other API / worker process to do the same."""
+    _drop(workspace_id)
+    try:
+        redis.Redis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1).publish(
+            INVALIDATION_CHANNEL, workspace_id
+        )
+    except Exception as e:
+        print(f"[Credentials] Failed to publish invalidation for {workspace_id}: {e}")
+
+
+def _listen():
+    backoff = 1
+    while True:
+        try:
+            client = redis.Redis.from_url(REDIS_URL, decode_responses=True, socket_connect_timeout=2)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything published while we weren't subscribed is lost: start clean
+            _drop(None)
+            backoff = 1
+            for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _drop(message.get("data"))
+        except Exception as e:
+            print(f"[Credentials] Invalidation listener disconnected, retrying in {backoff}s: {e}")
+        _drop(None)
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def _ensure_listener():
+    global _listener
+    if _listener is None:
+        with _lock:
+            if _listener is None:
+                _listener = threading.Thread(target=_listen, name="credentials-invalidation", daemon=True)
+                _listener.start()
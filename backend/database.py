@@ -1,17 +1,66 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from backend.tracing import trace_session_commits
 
 # Default to SQLite for local development compatibility if PG is not set
 # But in production (Railway), this MUST be set to the Postgres URL.
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./automation.db")
 
-check_same_thread = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+# Pool sizing, shared by the API's async engine and the sync engine (Celery worker, migrations)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle before managed Postgres / proxies drop idle connections
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# How long a SQLite writer waits on a lock before raising "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
-engine = create_engine(
-    DATABASE_URL, connect_args=check_same_thread
-)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets the API read while the worker is writing logs; NORMAL sync is
+    # durable across app crashes and only risks the last commit on power loss.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def build_engine(url: str, is_async: bool = False):
+    """create_engine / create_async_engine with per-backend performance settings."""
+    factory = create_async_engine if is_async else create_engine
+    if "sqlite" in url:
+        eng = factory(url, connect_args={"check_same_thread": False})
+        event.listen(eng.sync_engine if is_async else eng, "connect", _set_sqlite_pragmas)
+        return eng
+    return factory(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def pool_stats(eng):
+    """Checked-in / checked-out / overflow counts for an engine's pool."""
+    pool = eng.pool
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            try:
+                stats[name] = fn()
+            except Exception:
+                pass
+    return stats
+
+
+engine = build_engine(DATABASE_URL)
 
 # Debug: Print DB Connection
 safe_url = DATABASE_URL.split("@")[-1] if "@" in DATABASE_URL else "sqlite/local"
@@ -19,6 +68,29 @@ print(f"[Database] Connecting to: ...{safe_url}")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# --- Async engine (FastAPI app) ---
+# Same database, async driver: asyncpg for Postgres, aiosqlite locally.
+def to_async_url(url: str) -> str:
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        # asyncpg spells libpq's sslmode as ssl
+        return "postgresql+asyncpg://" + url.split("://", 1)[1].replace("sslmode=", "ssl=")
+    if url.startswith("sqlite:///"):
+        return "sqlite+aiosqlite:///" + url[len("sqlite:///"):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+async_engine = build_engine(ASYNC_DATABASE_URL, is_async=True)
+
+# expire_on_commit=False: endpoints return ORM objects after committing, and an
+# expired attribute would need a (forbidden) implicit async load to serialize.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# db.commit spans for commits made inside a trace (AsyncSession commits through a Session too)
+trace_session_commits(Session)
+
 Base = declarative_base()
 
 
@@ -29,6 +101,175 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _add_column_if_missing(conn, table: str, column: str, ddl_type: str):
+    from sqlalchemy import text
+    try:
+        conn.execute(text(f"SELECT {column} FROM {table} LIMIT 1"))
+    except Exception:
+        # Postgres aborts the transaction on the failed SELECT
+        conn.rollback()
+        print(f"⚠️ Column '{column}' missing in '{table}'. Adding...")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+        conn.commit()
+        print(f"✅ Added column '{column}'.")
+        return True
+    return False
+
+# (table, column, type) added after the initial schema
+ADDED_COLUMNS = [
+    # Per-run resource accounting
+    ("runs", "wall_seconds", "FLOAT"),
+    ("runs", "cpu_user_seconds", "FLOAT"),
+    ("runs", "cpu_system_seconds", "FLOAT"),
+    ("runs", "peak_rss_kb", "INTEGER"),
+    ("runs", "api_calls", "INTEGER"),
+    # Per-workspace concurrency cap
+    ("workspace_configs", "max_concurrent_runs", "INTEGER"),
+    # Indexed Stripe checkout session -> run mapping
+    ("runs", "stripe_session_id", "VARCHAR"),
+    # Run metadata copied out of args (admin list)
+    ("runs", "email", "VARCHAR"),
+    ("runs", "url", "TEXT"),
+    ("runs", "lead_limit", "INTEGER"),
+    # Worker liveness (stuck-run reaper)
+    ("runs", "heartbeat_at", "TIMESTAMP WITH TIME ZONE"),
+    # Trace context of the request that created the run (backend.tracing)
+    ("runs", "traceparent", "VARCHAR"),
+    # Client-generated id of instrumented events (idempotent ingestion)
+    ("logs", "event_id", "VARCHAR"),
+]
+
+def backfill_stripe_session_ids(conn):
+    """
+    One-off: copy session ids from legacy STRIPE_SESSION_ID logs onto
+    runs.stripe_session_id (run when the column is first added).
+    """
+    import json
+    from sqlalchemy import text
+    rows = conn.execute(text(
+        "SELECT run_id, data FROM logs WHERE event_type = 'STRIPE_SESSION_ID' ORDER BY id"
+    )).fetchall()
+    params = []
+    for run_id, data in rows:
+        try:
+            session_id = json.loads(data).get("session_id")
+        except Exception:
+            continue
+        if session_id:
+            params.append({"sid": session_id, "rid": run_id})
+    if params:
+        conn.execute(text("UPDATE runs SET stripe_session_id = :sid WHERE run_id = :rid"), params)
+    conn.commit()
+    print(f"✅ Backfilled stripe_session_id for {len(params)} runs.")
+
+def backfill_run_metadata(conn):
+    """One-off: fill runs.email / url / lead_limit from the args of existing runs."""
+    from sqlalchemy import text
+    from backend.models import run_metadata_from_args
+    rows = conn.execute(text("SELECT run_id, args FROM runs WHERE args IS NOT NULL")).fetchall()
+    params = []
+    for run_id, args in rows:
+        meta = run_metadata_from_args(args)
+        if any(v is not None for v in meta.values()):
+            params.append({"rid": run_id, **meta})
+    for i in range(0, len(params), BACKFILL_BATCH_SIZE):
+        conn.execute(
+            text("UPDATE runs SET email = :email, url = :url, lead_limit = :lead_limit WHERE run_id = :rid"),
+            params[i:i + BACKFILL_BATCH_SIZE]
+        )
+    conn.commit()
+    print(f"✅ Backfilled email/url/limit for {len(params)} runs.")
+
+# runs columns that moved from ISO-8601 strings to timezone-aware timestamps
+TIMESTAMP_COLUMNS = ("start_time", "end_time")
+BACKFILL_BATCH_SIZE = 1000
+
+def parse_legacy_timestamp(value):
+    """Legacy ISO string -> aware UTC datetime (naive strings were written as UTC). None if unparseable."""
+    from datetime import datetime, timezone
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+def _backfill_timestamps(conn, select_sql: str, update_sql: str, to_param):
+    """Re-parses run_id/value rows from select_sql and writes them back in batches."""
+    from sqlalchemy import text
+    rows = conn.execute(text(select_sql)).fetchall()
+    unparsed = 0
+    for i in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        params = []
+        for run_id, raw in rows[i:i + BACKFILL_BATCH_SIZE]:
+            parsed = parse_legacy_timestamp(raw)
+            if parsed is None:
+                unparsed += 1
+            params.append({"rid": run_id, "ts": to_param(parsed)})
+        if params:
+            conn.execute(text(update_sql), params)
+    return len(rows), unparsed
+
+def migrate_run_timestamps(conn):
+    """
+    One-off: convert runs.start_time / end_time from ISO strings to
+    timezone-aware timestamps.
+
+    Postgres: backfill a TIMESTAMPTZ shadow column, then swap it in (one transaction).
+    SQLite: column types are only affinities and SQLAlchemy stores DateTime as
+    'YYYY-MM-DD HH:MM:SS.ffffff' text, so rewrite legacy values into that
+    (UTC) format in place, which also makes them sort correctly.
+    """
+    from sqlalchemy import text
+    if conn.dialect.name == "postgresql":
+        for column in TIMESTAMP_COLUMNS:
+            data_type = conn.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'runs' AND column_name = :c"
+            ), {"c": column}).scalar()
+            if data_type is None or data_type == "timestamp with time zone":
+                continue
+            print(f"⚠️ Converting runs.{column} ({data_type}) to TIMESTAMPTZ...")
+            conn.execute(text(f"ALTER TABLE runs ADD COLUMN {column}_tz TIMESTAMPTZ"))
+            total, unparsed = _backfill_timestamps(
+                conn,
+                f"SELECT run_id, {column} FROM runs WHERE {column} IS NOT NULL AND {column} <> ''",
+                f"UPDATE runs SET {column}_tz = :ts WHERE run_id = :rid",
+                lambda dt: dt
+            )
+            conn.execute(text(f"ALTER TABLE runs DROP COLUMN {column}"))
+            conn.execute(text(f"ALTER TABLE runs RENAME COLUMN {column}_tz TO {column}"))
+            conn.commit()
+            print(f"✅ Converted runs.{column} ({total} values, {unparsed} unparseable set to NULL).")
+    elif conn.dialect.name == "sqlite":
+        # Anything not already in SQLAlchemy's storage format (ISO 'T' separator,
+        # offsets, 'Z', blanks) is legacy.
+        legacy = " OR ".join(
+            f"({c} IS NOT NULL AND ({c} LIKE '%T%' OR {c} LIKE '%+%' OR {c} LIKE '%Z' OR length({c}) <> 26))"
+            for c in TIMESTAMP_COLUMNS
+        )
+        if conn.execute(text(f"SELECT 1 FROM runs WHERE {legacy} LIMIT 1")).first() is None:
+            return
+        for column in TIMESTAMP_COLUMNS:
+            total, unparsed = _backfill_timestamps(
+                conn,
+                f"SELECT run_id, {column} FROM runs WHERE {column} IS NOT NULL",
+                f"UPDATE runs SET {column} = :ts WHERE run_id = :rid",
+                lambda dt: dt.replace(tzinfo=None).strftime("%Y-%m-%d %H:%M:%S.%f") if dt else None
+            )
+            conn.commit()
+            print(f"✅ Normalized runs.{column} ({total} values, {unparsed} unparseable set to NULL).")
+
 def run_migrations():
     """
     Simple auto-migration to ensure schema is up to date without full Alembic setup.
@@ -53,7 +294,50 @@ def run_migrations():
                 conn.execute(text("ALTER TABLE runs ADD COLUMN env_vars TEXT"))
                 conn.commit()
                 print("✅ Added column 'env_vars'.")
-                
+
+            added = set()
+            for table, column, ddl_type in ADDED_COLUMNS:
+                if _add_column_if_missing(conn, table, column, ddl_type):
+                    added.add((table, column))
+
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_runs_stripe_session_id ON runs (stripe_session_id)"))
+            conn.commit()
+            if ("runs", "stripe_session_id") in added:
+                backfill_stripe_session_ids(conn)
+
+            migrate_run_timestamps(conn)
+            # Newest-first run listings and status-filtered dashboards
+            conn.execute(text("DROP INDEX IF EXISTS ix_runs_start_time"))
+            if conn.dialect.name == "postgresql":
+                # Admin listing orders NULL start_times last (SQLite's DESC already does)
+                indexdef = conn.execute(text(
+                    "SELECT indexdef FROM pg_indexes WHERE indexname = 'ix_runs_start_time_run_id'"
+                )).scalar()
+                if indexdef and "NULLS LAST" not in indexdef:
+                    conn.execute(text("DROP INDEX ix_runs_start_time_run_id"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_runs_start_time_run_id ON runs (start_time DESC NULLS LAST, run_id DESC)"))
+            else:
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_runs_start_time_run_id ON runs (start_time DESC, run_id DESC)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_runs_status_start_time ON runs (status, start_time)"))
+            conn.commit()
+
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_runs_email ON runs (email)"))
+            conn.commit()
+            if ("runs", "email") in added:
+                backfill_run_metadata(conn)
+
+            # Lead exports by run, case-insensitive email dedupe
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_leads_run_id ON leads (run_id)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_leads_email_lower ON leads (lower(email))"))
+            conn.commit()
+
+            # Composite index for keyset-paginated log reads
+            # (create_all does not add indexes to existing tables)
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_logs_run_id_id ON logs (run_id, id)"))
+            # ON CONFLICT target for POST /api/logs (NULLs, i.e. worker output, don't collide)
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_logs_event_id ON logs (event_id)"))
+            conn.commit()
+
             print("✅ Database Schema Checked.")
     except Exception as e:
         print(f"❌ Migration check failed (Expected if tables don't exist yet): {e}")
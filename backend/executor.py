@@ -0,0 +1,213 @@
+import io
+import json
+import multiprocessing
+import os
+import resource
+import runpy
+import socket
+import subprocess
+import sys
+import traceback
+from typing import Dict, List
+
+# How run_script_task launches execution scripts:
+#   subprocess (default) - fresh `python3 -u script.py` per job
+#   forkserver           - fork from a warm interpreter that already imported
+#                          the heavy `execution` dependencies (see PRELOAD_MODULES)
+EXECUTOR_MODE = os.getenv("SCRIPT_EXECUTOR", "subprocess").lower()
+
+# Imported once by the fork server; missing modules are skipped silently.
+PRELOAD_MODULES = [
+    m.strip() for m in os.getenv(
+        "SCRIPT_EXECUTOR_PRELOAD",
+        "requests,dotenv,pandas,gspread,googleapiclient.discovery,google.oauth2.service_account,"
+        "sqlalchemy,redis,bs4,openpyxl"
+    ).split(",") if m.strip()
+]
+
+_context = None
+
+
+def _get_context():
+    global _context
+    if _context is None:
+        _context = multiprocessing.get_context("forkserver")
+        _context.set_forkserver_preload(PRELOAD_MODULES)
+    return _context
+
+
+def warm_up():
+    """Starts the fork server (and its preloads) ahead of the first job."""
+    if EXECUTOR_MODE != "forkserver":
+        return
+    try:
+        from multiprocessing import forkserver
+        _get_context()
+        forkserver.ensure_running()
+        print(f"[Executor] Fork server ready (preloaded: {', '.join(PRELOAD_MODULES)})")
+    except Exception as e:
+        print(f"[Executor] Fork server warm-up failed, will retry on first job: {e}")
+
+
+def _rusage_to_dict(*usages) -> Dict:
+    """Sums CPU times and takes the peak RSS over one or more rusage structs."""
+    peak_rss = max(u.ru_maxrss for u in usages)
+    if sys.platform == "darwin":
+        peak_rss //= 1024  # bytes on macOS, KiB on Linux
+    return {
+        "cpu_user_seconds": sum(u.ru_utime for u in usages),
+        "cpu_system_seconds": sum(u.ru_stime for u in usages),
+        "peak_rss_kb": int(peak_rss),
+    }
+
+
+def _run_job(out_sock, stats_sock, script_path: str, args: List[str], env: Dict[str, str]):
+    """
+    Runs inside the forked child. Mirrors `python3 -u script.py args...`:
+    stdout/stderr go to the parent's pipe, env is replaced, sys.argv and
+    sys.path[0] point at the script, and the exit code follows the same rules
+    as the interpreter (SystemExit code, 1 on uncaught exception).
+    """
+    fd = out_sock.fileno()
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    out_sock.close()
+    sys.stdout = io.TextIOWrapper(os.fdopen(1, "wb", 0), write_through=True, line_buffering=True)
+    sys.stderr = io.TextIOWrapper(os.fdopen(2, "wb", 0), write_through=True, line_buffering=True)
+
+    os.environ.clear()
+    os.environ.update(env)
+    os.environ["PYTHONUNBUFFERED"] = "1"
+    script_path = os.path.abspath(script_path)
+    sys.argv = [script_path] + list(args)
+    sys.path.insert(0, os.path.dirname(script_path))
+
+    code = 0
+    try:
+        runpy.run_path(script_path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        # Drop the executor/runpy frames so the traceback looks like `python3 script.py`
+        etype, value, tb = sys.exc_info()
+        while tb is not None and tb.tb_frame.f_code.co_filename != script_path:
+            tb = tb.tb_next
+        traceback.print_exception(etype, value, tb or sys.exc_info()[2])
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+
+    # os._exit below skips atexit: write the job's buffered spans now
+    tracing = sys.modules.get("backend.tracing")
+    if tracing is not None:
+        tracing.flush()
+
+    # The fork server, not run_script_task, is our parent, so report our own
+    # rusage (plus reaped children) back over a side channel.
+    try:
+        usage = _rusage_to_dict(resource.getrusage(resource.RUSAGE_SELF),
+                                resource.getrusage(resource.RUSAGE_CHILDREN))
+        stats_sock.sendall(json.dumps(usage).encode())
+        stats_sock.close()
+    except Exception:
+        pass
+    os._exit(code)
+
+
+class WarmProcess:
+    """Popen-like handle (stdout / wait / returncode) for a forked job."""
+
+    def __init__(self, script_path: str, args: List[str], env: Dict[str, str]):
+        parent_sock, child_sock = socket.socketpair()
+        stats_parent, stats_child = socket.socketpair()
+        self._sock = parent_sock
+        self._stats_sock = stats_parent
+        self._process = _get_context().Process(
+            target=_run_job, args=(child_sock, stats_child, script_path, args, env), daemon=False
+        )
+        self._process.start()
+        child_sock.close()
+        stats_child.close()
+        self.stdout = parent_sock.makefile("r", encoding="utf-8", errors="replace", newline=None)
+        self.pid = self._process.pid
+        self.returncode = None
+
+    def wait(self):
+        self._process.join()
+        # Negative on signal death, same convention as subprocess
+        self.returncode = self._process.exitcode
+        self.stdout.close()
+        self._sock.close()
+        return self.returncode
+
+    def wait_with_rusage(self):
+        returncode = self.wait()
+        usage = {}
+        try:
+            chunks = []
+            while True:
+                chunk = self._stats_sock.recv(4096)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            if chunks:
+                usage = json.loads(b"".join(chunks))
+        except Exception:
+            pass
+        finally:
+            self._stats_sock.close()
+        return returncode, usage
+
+    def kill(self):
+        self._process.kill()
+
+
+def wait_with_rusage(process):
+    """
+    Waits for a process from start_script and returns (returncode, usage),
+    where usage has cpu_user_seconds / cpu_system_seconds / peak_rss_kb
+    (empty if unavailable).
+    """
+    if isinstance(process, WarmProcess):
+        return process.wait_with_rusage()
+
+    # Reap with wait4 ourselves to get the child's rusage, then hand the
+    # status back to Popen so process.returncode / wait() stay consistent.
+    try:
+        _, status, ru = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode, _rusage_to_dict(ru)
+    except ChildProcessError:
+        return process.wait(), {}
+
+
+def start_script(script_path: str, args: List[str], env: Dict[str, str], mode: str = None):
+    """
+    Launches an execution script and returns a Popen-like object whose
+    `stdout` yields merged stdout/stderr lines.
+    """
+    if (mode or EXECUTOR_MODE) == "forkserver":
+        try:
+            return WarmProcess(script_path, args, env)
+        except Exception as e:
+            print(f"[Executor] Fork server unavailable, falling back to subprocess: {e}")
+
+    cmd = ["python3", "-u", script_path] + list(args)
+    return subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        env=env,
+        bufsize=1
+    )
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+from datetime import timedelta
+from typing import Dict
+
+from sqlalchemy import and_, func, or_, update
+
+from backend.database import SessionLocal
+from backend.models import Run, Log, utc_now
+
+# run_script_task stamps runs.heartbeat_at this often while the script runs
+HEARTBEAT_INTERVAL_SECONDS = int(os.getenv("RUN_HEARTBEAT_INTERVAL", "30"))
+# A RUNNING run whose heartbeat is older than this is considered dead
+STALL_TIMEOUT_SECONDS = int(os.getenv("RUN_STALL_TIMEOUT", "300"))
+# Scripts that are safe to start over from scratch after a worker died
+IDEMPOTENT_SCRIPTS = {
+    s.strip() for s in os.getenv("IDEMPOTENT_SCRIPTS", "check_api_keys.py,check_latest_run_status.py").split(",")
+    if s.strip()
+}
+# How many times the reaper re-enqueues the same run
+MAX_REQUEUES = int(os.getenv("RUN_MAX_REQUEUES", "1"))
+
+STALLED_EVENT = "STALLED"
+
+
+class RunHeartbeat:
+    """
+    Background thread that stamps runs.heartbeat_at every interval while a
+    run is RUNNING (own session, so it never touches the task's session).
+    """
+
+    def __init__(self, run_id: str, interval: float = HEARTBEAT_INTERVAL_SECONDS, session_factory=SessionLocal):
+        self.run_id = run_id
+        self.interval = interval
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        self.beat()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{self.run_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def beat(self):
+        db = self.session_factory()
+        try:
+            # Only while RUNNING: a run the reaper already marked STALLED stays stalled
+            db.execute(
+                update(Run)
+                .where(Run.run_id == self.run_id, Run.status == "RUNNING")
+                .values(heartbeat_at=utc_now())
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[Heartbeat] Failed for {self.run_id}: {e}")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.beat()
+
+
+def reap_stalled_runs(db, stall_timeout: int = STALL_TIMEOUT_SECONDS) -> Dict:
+    """
+    Marks RUNNING runs with no heartbeat for `stall_timeout` seconds as
+    STALLED, frees their workspace slot and ends their live stream. Runs of
+    IDEMPOTENT_SCRIPTS are re-enqueued (up to MAX_REQUEUES times).
+    """
+    from backend.concurrency import release_slot, workspace_for_args
+    from backend.log_stream import RunLogPublisher
+    from backend.run_cache import bump_runs_version
+
+    cutoff = utc_now() - timedelta(seconds=stall_timeout)
+    stalled = db.query(Run).filter(
+        Run.status == "RUNNING",
+        or_(
+            Run.heartbeat_at < cutoff,
+            # Started before heartbeats existed / died before the first beat
+            and_(Run.heartbeat_at.is_(None), Run.start_time < cutoff)
+        )
+    ).all()
+
+    reaped = requeued = 0
+    for run in stalled:
+        previous = db.query(func.count(Log.id)).filter(
+            Log.run_id == run.run_id, Log.event_type == STALLED_EVENT
+        ).scalar()
+        requeue = os.path.basename(run.script_name or "") in IDEMPOTENT_SCRIPTS and previous < MAX_REQUEUES
+
+        run.status = "QUEUED" if requeue else "STALLED"
+        if not requeue:
+            run.end_time = utc_now()
+        db.add(Log(
+            run_id=run.run_id,
+            timestamp=utc_now().isoformat(),
+            event_type=STALLED_EVENT,
+            data=json.dumps({
+                "last_heartbeat": run.heartbeat_at.isoformat() if run.heartbeat_at else None,
+                "requeued": requeue
+            })
+        ))
+        db.commit()
+        reaped += 1
+
+        workspace_id = workspace_for_args(run.args)
+        if workspace_id:
+            release_slot(workspace_id, run.run_id)
+
+        if requeue:
+            from backend.tasks import run_script_task
+            args = json.loads(run.args) if run.args else []
+            env_vars = json.loads(run.env_vars) if run.env_vars else {}
+            run_script_task.delay(run.script_name, args, env_vars, run.run_id)
+            requeued += 1
+            print(f"[Reaper] Run {run.run_id} stalled, re-enqueued")
+        else:
+            RunLogPublisher(run.run_id).close("STALLED")
+            print(f"[Reaper] Run {run.run_id} marked STALLED")
+
+    if reaped:
+        bump_runs_version()
+    return {"stalled": reaped, "requeued": requeued}
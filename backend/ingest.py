@@ -0,0 +1,105 @@
+import json
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import parse_legacy_timestamp
+from backend.models import Run, Log, StepStat, utc_now
+
+# Events accepted per request (keeps one INSERT well under driver parameter limits)
+MAX_INGEST_BATCH = 5000
+
+
+def _insert_ignoring(db: AsyncSession, model, *keys: str):
+    """INSERT ... ON CONFLICT (keys) DO NOTHING for the session's dialect."""
+    insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    return insert(model).on_conflict_do_nothing(index_elements=list(keys))
+
+
+def normalize_status(status: str) -> str:
+    # Instrumented scripts report "running" / "completed"; runs use upper case
+    return (status or "RUNNING").upper()
+
+
+async def ingest_runs(db: AsyncSession, runs: List[Dict]) -> Dict:
+    """
+    Registers runs reported by instrumented scripts. Idempotent by run_id: a
+    retried registration (or one for a run the API already created) is a no-op.
+    """
+    rows = {}
+    for run in runs:
+        rows[run["run_id"]] = {
+            "run_id": run["run_id"],
+            "script_name": run["script_name"],
+            "status": normalize_status(run.get("status")),
+            "start_time": parse_legacy_timestamp(run.get("start_time")) or utc_now(),
+        }
+    if not rows:
+        return {"created": 0, "duplicates": 0}
+    result = await db.execute(_insert_ignoring(db, Run, "run_id").returning(Run.run_id), list(rows.values()))
+    created = len(result.all())
+    await db.commit()
+    return {"created": created, "duplicates": len(runs) - created}
+
+
+async def ingest_logs(db: AsyncSession, events: List[Dict]) -> Dict:
+    """
+    Stores a batch of step events with one multi-row INSERT. Idempotent by the
+    client's event_id (ON CONFLICT DO NOTHING on the unique index), so a
+    shipper can retry a whole batch. Events for unknown runs are skipped.
+    """
+    run_ids = {e["run_id"] for e in events}
+    known = set((await db.execute(select(Run.run_id).where(Run.run_id.in_(run_ids)))).scalars())
+
+    rows = {}
+    unknown = 0
+    for event in events:
+        if event["run_id"] not in known:
+            unknown += 1
+            continue
+        row = {
+            "event_id": event.get("event_id"),
+            "run_id": event["run_id"],
+            "timestamp": event["timestamp"],
+            "event_type": event["event_type"],
+            "data": json.dumps(event["data"], default=str),
+        }
+        # Repeats within the batch collapse here; events without an id are always kept
+        rows[row["event_id"] or id(row)] = row
+
+    stored = 0
+    if rows:
+        result = await db.execute(_insert_ignoring(db, Log, "event_id").returning(Log.id), list(rows.values()))
+        stored = len(result.all())
+        await db.commit()
+    return {"stored": stored, "duplicates": len(events) - unknown - stored, "unknown_run": unknown}
+
+
+async def ingest_step_stats(db: AsyncSession, flush: Dict) -> Dict:
+    """
+    Stores one periodic @step flush ({flush_id, run_id, script_name, steps:
+    {name: aggregate}}), one row per step. Idempotent by (flush_id, step).
+    """
+    rows = [{
+        "flush_id": flush["flush_id"],
+        "run_id": flush.get("run_id"),
+        "script_name": flush["script_name"],
+        "step_name": name,
+        "count": agg["count"],
+        "errors": agg.get("errors") or 0,
+        "sum_ns": agg["sum_ns"],
+        "min_ns": agg.get("min_ns"),
+        "max_ns": agg.get("max_ns"),
+        "buckets": agg["buckets"],
+    } for name, agg in flush["steps"].items()]
+    if not rows:
+        return {"stored": 0}
+    result = await db.execute(
+        _insert_ignoring(db, StepStat, "flush_id", "step_name").returning(StepStat.id), rows
+    )
+    stored = len(result.all())
+    await db.commit()
+    return {"stored": stored}
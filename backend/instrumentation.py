@@ -1,14 +1,172 @@
 import os
+import json
+import queue
+import atexit
+import threading
+import time
 import requests
 import functools
 import traceback
 import sys
 import uuid
 import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+from backend.step_stats import StepAggregate
 
 # Simple configuration
 API_BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:8000/api")
+# Events waiting to be shipped; past this, new events are dropped (never block the script)
+EVENT_QUEUE_SIZE = int(os.environ.get("AUTOMATION_EVENT_QUEUE_SIZE", "10000"))
+# Max events per bulk POST, and how long the shipper waits to fill a batch
+EVENT_BATCH_SIZE = int(os.environ.get("AUTOMATION_EVENT_BATCH_SIZE", "500"))
+EVENT_FLUSH_INTERVAL = float(os.environ.get("AUTOMATION_EVENT_FLUSH_INTERVAL", "0.5"))
+# How long interpreter exit waits for the last events to go out
+EVENT_EXIT_TIMEOUT = float(os.environ.get("AUTOMATION_EVENT_EXIT_TIMEOUT", "5"))
+# How often per-step duration aggregates are sent to /api/steps/stats
+STEP_STATS_FLUSH_INTERVAL = float(os.environ.get("AUTOMATION_STEP_STATS_INTERVAL", "10"))
+# 0 = timings only, no step_start/step_end event per call (for per-row steps)
+STEP_EVENTS = os.environ.get("AUTOMATION_STEP_EVENTS", "1") != "0"
+
+
+class EventShipper:
+    """
+    Ships step events in the background: callers enqueue without waiting,
+    a daemon thread drains the queue and POSTs batches (a JSON array) to
+    /api/logs over one keep-alive session. Flushed at exit via atexit.
+    """
+
+    def __init__(self, url: str, session: requests.Session, maxsize: int = EVENT_QUEUE_SIZE,
+                 batch_size: int = EVENT_BATCH_SIZE, flush_interval: float = EVENT_FLUSH_INTERVAL):
+        self.url = url
+        self.session = session
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._registered = False
+
+    def put(self, event: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1:
+                sys.stderr.write("[Warning] Event queue full, dropping step events\n")
+            return
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="automation-events", daemon=True)
+                self._thread.start()
+                if not self._registered:
+                    atexit.register(self.close)
+                    self._registered = True
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                # Deadline passed or exiting: take what is already queued, no more waiting
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._ship(batch)
+
+    def _ship(self, batch: List[Dict[str, Any]]):
+        try:
+            self.session.post(self.url, json=batch, timeout=5)
+        except Exception:
+            # Fail silently so we don't break the actual script
+            pass
+
+    def close(self, timeout: float = EVENT_EXIT_TIMEOUT):
+        """
+        Ships whatever is queued (up to `timeout` seconds), then stops the thread.
+        A later put() starts a new one, so events after finish_run still ship.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stop.set()
+            thread.join(timeout)
+            if not thread.is_alive():
+                self._thread = None
+                self._stop.clear()
+
+class StepRecorder:
+    """
+    In-memory duration aggregates per step name (see backend.step_stats),
+    sent to /api/steps/stats every flush interval and at exit. Recording is
+    a dict update under a lock, no I/O per call.
+    """
+
+    def __init__(self, ctx, interval: float = STEP_STATS_FLUSH_INTERVAL):
+        self.ctx = ctx
+        self.interval = interval
+        self._aggregates: Dict[str, StepAggregate] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, step_name: str, duration_ns: int, failed: bool = False):
+        with self._lock:
+            agg = self._aggregates.get(step_name)
+            if agg is None:
+                agg = self._aggregates[step_name] = StepAggregate()
+            agg.record(duration_ns, failed)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="automation-step-stats", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def flush(self):
+        with self._lock:
+            aggregates, self._aggregates = self._aggregates, {}
+        if not aggregates or not self.ctx.script_name:
+            return
+        payload = {
+            "flush_id": str(uuid.uuid4()),
+            "run_id": self.ctx.run_id,
+            "script_name": self.ctx.script_name,
+            "steps": {name: agg.to_dict() for name, agg in aggregates.items()},
+        }
+        try:
+            self.ctx.session.post(f"{self.ctx.api_url}/steps/stats", json=payload, timeout=5)
+        except Exception:
+            pass
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
 
 class AutomationContext:
     _instance = None
@@ -18,14 +176,21 @@ class AutomationContext:
             cls._instance = super(AutomationContext, cls).__new__(cls)
             cls._instance.run_id = None
             cls._instance.script_name = None
+            cls._instance.owns_run = False
             cls._instance.api_url = API_BASE_URL
+            # One keep-alive connection for every call this script makes
+            cls._instance.session = requests.Session()
+            cls._instance.events = EventShipper(f"{API_BASE_URL}/logs", cls._instance.session)
+            cls._instance.step_stats = StepRecorder(cls._instance)
         return cls._instance
 
     def initialize(self, script_name: str, run_id: str = None):
         self.script_name = script_name
         self.run_id = run_id or str(uuid.uuid4())
-        # Register the run with the backend if we generated a new ID
-        if not run_id:
+        # Register the run with the backend if we generated a new ID; a run_id
+        # handed in (RUN_ID from the worker) belongs to the task runner
+        self.owns_run = not run_id
+        if self.owns_run:
            self._register_run()
 
     def _register_run(self):
@@ -36,7 +201,7 @@ class AutomationContext:
                 "status": "running",
                 "start_time": datetime.datetime.now().isoformat()
             }
-            requests.post(f"{self.api_url}/runs", json=payload, timeout=2)
+            self.session.post(f"{self.api_url}/runs", json=payload, timeout=2)
          except Exception as e:
              # Fail silently so we don't break the actual script
              print(f"[Warning] Failed to register run: {e}")
@@ -51,9 +216,15 @@ class AutomationContext:
          self._send_event("error", {"step_name": step_name, "error": str(error)})
 
     def finish_run(self, status="completed"):
+        # Step events first, so the run doesn't close before its last steps arrive
+        self.events.close()
+        self.step_stats.close()
+        # The worker sets status / end_time of its own runs from the exit code
+        if not self.owns_run:
+            return
         try:
              payload = {"status": status, "end_time": datetime.datetime.now().isoformat()}
-             requests.put(f"{self.api_url}/runs/{self.run_id}", json=payload, timeout=2)
+             self.session.put(f"{self.api_url}/runs/{self.run_id}", json=payload, timeout=2)
         except Exception:
             pass
 
@@ -61,23 +232,19 @@ class AutomationContext:
         if not self.run_id:
             return
         
-        payload = {
+        # Queued, not sent: the background shipper batches events into one POST
+        self.events.put({
+            "event_id": str(uuid.uuid4()),
             "run_id": self.run_id,
             "timestamp": datetime.datetime.now().isoformat(),
             "event_type": event_type,
             "data": data
-        }
-        
-        try:
-            requests.post(f"{self.api_url}/logs", json=payload, timeout=1)
-        except Exception as e:
-            # We print to stderr just in case, but usually we want to be silent in prod
-            # sys.stderr.write(f"Failed to log event: {e}\n")
-            pass
+        })
 
 def step(name: str):
     """
     Decorator to wrap a function as a step in the visual automation graph.
+    Every call is timed into the step's duration histogram (GET /api/steps/stats).
     """
     def decorator(func):
         @functools.wraps(func)
@@ -89,23 +256,39 @@ def step(name: str):
             if not ctx.run_id:
                 # Try to guess script name from main file
                 script_name = os.path.basename(sys.argv[0])
-                ctx.initialize(script_name)
+                ctx.initialize(script_name, os.environ.get("RUN_ID"))
 
-            ctx.log_step_start(name, step_id)
+            if STEP_EVENTS:
+                ctx.log_step_start(name, step_id)
             
+            # Only the wrapped call is timed, not the event bookkeeping around it
+            start_ns = time.perf_counter_ns()
             try:
                 result = func(*args, **kwargs)
-                ctx.log_step_end(name, step_id, "success", output=str(result)[:500]) # Truncate output
-                return result
             except Exception as e:
-                ctx.log_error(name, traceback.format_exc())
-                ctx.log_step_end(name, step_id, "failed", output=str(e))
+                ctx.step_stats.record(name, time.perf_counter_ns() - start_ns, failed=True)
+                if STEP_EVENTS:
+                    ctx.log_error(name, traceback.format_exc())
+                    ctx.log_step_end(name, step_id, "failed", output=str(e))
                 raise e
+            ctx.step_stats.record(name, time.perf_counter_ns() - start_ns)
+            if STEP_EVENTS:
+                ctx.log_step_end(name, step_id, "success", output=str(result)[:500]) # Truncate output
+            return result
         return wrapper
     return decorator
 
+def emit_result(**fields):
+    """
+    Reports typed run results (sheet_url, lead_count, csv_path, credits_used, ...)
+    to the task runner, which stores them in `run_results` as they arrive.
+    """
+    print(f"[RESULT] {json.dumps(fields, default=str)}")
+    sys.stdout.flush()
+
 # Initializer for the main block
 def init(script_name: str):
     ctx = AutomationContext()
-    ctx.initialize(script_name)
+    # Under the worker, events belong to the Celery-created run
+    ctx.initialize(script_name, os.environ.get("RUN_ID"))
     return ctx
@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from backend.database import AsyncSessionLocal
+from backend.models import Lead
+
+# Exportable columns, in output order
+LEAD_EXPORT_COLUMNS = (
+    "id", "run_id", "first_name", "last_name", "email", "company",
+    "title", "linkedin_url", "location", "raw_data",
+)
+EXPORT_FORMATS = ("json", "csv", "ndjson")
+# Rows fetched per round trip from the server-side cursor
+EXPORT_CHUNK_SIZE = 500
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """'first_name,email' -> validated column list (all columns if empty)."""
+    if not fields:
+        return list(LEAD_EXPORT_COLUMNS)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in LEAD_EXPORT_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown lead fields: {', '.join(unknown)}")
+    return selected
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+async def stream_leads(run_id: str, columns: List[str], fmt: str):
+    """
+    Async generator of CSV / NDJSON chunks for a run's leads. Reads through a
+    server-side cursor (yield_per) with its own session, so only one chunk
+    of rows is in memory however many leads the run has.
+    """
+    query = (
+        select(*[getattr(Lead, c) for c in columns])
+        .where(Lead.run_id == run_id)
+        .order_by(Lead.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            for row in rows:
+                if writer:
+                    writer.writerow([_csv_value(v) for v in row])
+                else:
+                    buffer.write(json.dumps(dict(zip(columns, row)), default=str))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode()
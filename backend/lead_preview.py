@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from backend.provider_checks import get_client
+
+APOLLO_API_URL = "https://api.apollo.io/v1/mixed_people/search"
+PREVIEW_ROWS = 10
+PREVIEW_CACHE_TTL_SECONDS = int(os.getenv("PREVIEW_CACHE_TTL", "120"))
+PREVIEW_CACHE_MAX_ENTRIES = 500
+PREVIEW_TIMEOUT_SECONDS = 15
+
+_cache: Dict[str, tuple] = {}               # payload hash -> (expires_at, rows)
+_inflight: Dict[str, asyncio.Future] = {}   # payload hash -> upstream call in progress
+
+
+def canonical_payload(apollo_url: str) -> Optional[Dict]:
+    """
+    Apollo search payload for the first preview page. Filter lists are sorted
+    so URLs that differ only in parameter order share a cache entry.
+    """
+    from execution.url_parser import parse_apollo_url
+
+    payload = parse_apollo_url(apollo_url)
+    if not payload:
+        return None
+    canonical = {
+        key: sorted(value, key=str) if isinstance(value, list) else value
+        for key, value in payload.items()
+    }
+    canonical["page"] = 1
+    canonical["per_page"] = PREVIEW_ROWS
+    return canonical
+
+
+def payload_key(payload: Dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+async def _fetch_people(payload: Dict) -> Optional[List[Dict]]:
+    """One per_page=10 search. None on failure (not cached)."""
+    api_key = os.getenv("APOLLO_API_KEY")
+    if not api_key:
+        print("[Preview] APOLLO_API_KEY not set.")
+        return None
+    headers = {"Content-Type": "application/json", "Cache-Control": "no-cache", "X-Api-Key": api_key}
+    client = get_client()
+    for attempt in range(3):
+        try:
+            resp = await client.post(APOLLO_API_URL, headers=headers, json=payload, timeout=PREVIEW_TIMEOUT_SECONDS)
+        except httpx.HTTPError as e:
+            print(f"[Preview] Apollo request failed: {e!r}")
+            return None
+        if resp.status_code == 200:
+            return resp.json().get("people", [])
+        if resp.status_code == 429:
+            await asyncio.sleep(attempt + 1)
+            continue
+        print(f"[Preview] Apollo API Error: {resp.status_code}")
+        return None
+    return None
+
+
+def _to_rows(people: List[Dict]) -> List[Dict]:
+    from execution.lead_gen_orchestrator import build_preview_rows
+
+    leads = []
+    seen_ids = set()
+    for person in people:
+        if person.get("id") in seen_ids:
+            continue
+        seen_ids.add(person.get("id"))
+        # Preview skips enrichment: Apollo's (possibly locked) email stands in
+        email = person.get("email") or "preview@hidden.com"
+        if email.strip() and "unable" not in email.lower():
+            leads.append(dict(person, blitz_email=email))
+    return build_preview_rows(leads[:PREVIEW_ROWS])
+
+
+async def _load(key: str, payload: Dict) -> List[Dict]:
+    people = await _fetch_people(payload)
+    if people is None:
+        return []
+    rows = _to_rows(people)
+    now = time.monotonic()
+    if len(_cache) >= PREVIEW_CACHE_MAX_ENTRIES:
+        for stale in [k for k, (expires_at, _) in _cache.items() if expires_at <= now] or list(_cache)[:1]:
+            _cache.pop(stale, None)
+    _cache[key] = (now + PREVIEW_CACHE_TTL_SECONDS, rows)
+    return rows
+
+
+async def get_preview(apollo_url: str) -> List[Dict]:
+    """
+    Preview rows for an Apollo search URL, served from the cache when fresh.
+    Concurrent identical requests share one upstream call.
+    """
+    payload = canonical_payload(apollo_url)
+    if payload is None:
+        return []
+    key = payload_key(payload)
+
+    entry = _cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_load(key, payload))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: one caller disconnecting must not cancel the shared fetch
+    return await asyncio.shield(future)
@@ -0,0 +1,142 @@
+import gzip
+import json
+import os
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, select
+
+from backend.models import Run, Log, RunLogArchive, utc_now
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Logs of runs that finished more than this many days ago get compacted
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "14"))
+# Runs archived per compaction pass (each run is its own transaction)
+COMPACTION_BATCH_SIZE = int(os.getenv("LOG_COMPACTION_BATCH", "200"))
+# Tiny rows kept in place as the payment audit trail
+KEEP_EVENT_TYPES = ("STRIPE_SESSION_ID",)
+FINISHED_STATUSES = ("COMPLETED", "FAILED", "ERROR", "STALLED")
+
+
+def _compress(raw: bytes):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(raw)
+    return "gzip", gzip.compress(raw, compresslevel=6)
+
+
+def _decompress(codec: str, blob: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archive is zstd-compressed but the 'zstandard' package is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+def archive_run_logs(db, run_id: str) -> int:
+    """Packs a run's logs into run_log_archives and deletes the rows. Returns lines archived."""
+    rows = (
+        db.query(Log.id, Log.timestamp, Log.event_type, Log.data)
+        .filter(Log.run_id == run_id, Log.event_type.notin_(KEEP_EVENT_TYPES))
+        .order_by(Log.id.asc())
+        .all()
+    )
+    if not rows:
+        return 0
+
+    raw = "\n".join(json.dumps([r.id, r.timestamp, r.event_type, r.data]) for r in rows).encode()
+    codec, blob = _compress(raw)
+    db.add(RunLogArchive(
+        run_id=run_id,
+        codec=codec,
+        line_count=len(rows),
+        first_log_id=rows[0].id,
+        last_log_id=rows[-1].id,
+        raw_bytes=len(raw),
+        blob=blob
+    ))
+    db.execute(
+        delete(Log).where(
+            Log.run_id == run_id,
+            Log.id <= rows[-1].id,
+            Log.event_type.notin_(KEEP_EVENT_TYPES)
+        )
+    )
+    db.commit()
+    return len(rows)
+
+
+def compact_old_logs(db, older_than_days: int = LOG_RETENTION_DAYS, batch_size: int = COMPACTION_BATCH_SIZE) -> Dict:
+    """One compaction pass over runs that finished before the retention cutoff."""
+    cutoff = utc_now() - timedelta(days=older_than_days)
+    already_archived = select(RunLogArchive.run_id)
+    run_ids = [
+        r.run_id for r in db.query(Run.run_id)
+        .filter(
+            Run.status.in_(FINISHED_STATUSES),
+            Run.end_time.isnot(None),
+            Run.end_time < cutoff,
+            Run.run_id.notin_(already_archived),
+            db.query(Log.id).filter(Log.run_id == Run.run_id).exists()
+        )
+        .limit(batch_size)
+        .all()
+    ]
+
+    runs = lines = 0
+    for run_id in run_ids:
+        try:
+            archived = archive_run_logs(db, run_id)
+            if archived:
+                runs += 1
+                lines += archived
+        except Exception as e:
+            db.rollback()
+            print(f"[LogArchive] Failed to compact {run_id}: {e}")
+
+    print(f"[LogArchive] Compacted {lines} log lines from {runs} runs (cutoff {cutoff})")
+    return {"runs": runs, "lines": lines, "has_more": len(run_ids) == batch_size}
+
+
+# Decompressed archives are immutable, so a small per-process LRU lets the
+# frontend page through an old run without re-inflating it on every request.
+_ARCHIVE_CACHE: "OrderedDict[str, List[Dict]]" = OrderedDict()
+_ARCHIVE_CACHE_SIZE = 16
+
+
+def load_archived_logs(db, run_id: str) -> Optional[List[Dict]]:
+    """Archived log rows for a run (ascending id), or None if it has no archive."""
+    if run_id in _ARCHIVE_CACHE:
+        _ARCHIVE_CACHE.move_to_end(run_id)
+        return _ARCHIVE_CACHE[run_id]
+
+    archive = db.query(RunLogArchive.codec, RunLogArchive.blob).filter(RunLogArchive.run_id == run_id).first()
+    if not archive:
+        return None
+
+    rows = []
+    for line in _decompress(archive.codec, archive.blob).decode().split("\n"):
+        log_id, timestamp, event_type, data = json.loads(line)
+        rows.append({"id": log_id, "timestamp": timestamp, "event_type": event_type, "data": data})
+
+    _ARCHIVE_CACHE[run_id] = rows
+    if len(_ARCHIVE_CACHE) > _ARCHIVE_CACHE_SIZE:
+        _ARCHIVE_CACHE.popitem(last=False)
+    return rows
+
+
+def page_rows(rows: List[Dict], after_id: Optional[int], before_id: Optional[int],
+              limit: int, event_type: Optional[str] = None):
+    """In-memory equivalent of the keyset query in fetch_log_page. Returns (page, has_more)."""
+    if event_type:
+        rows = [r for r in rows if r["event_type"] == event_type]
+    if after_id is not None:
+        selected = [r for r in rows if r["id"] > after_id]
+        return selected[:limit], len(selected) > limit
+    if before_id is not None:
+        rows = [r for r in rows if r["id"] < before_id]
+    return rows[-limit:], len(rows) > limit
@@ -0,0 +1,124 @@
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+import redis
+
+from backend.celery_app import REDIS_URL
+
+# Per-run capped stream of script output. Approximate trimming (~) lets Redis
+# drop whole macro-nodes, which is much cheaper than exact MAXLEN.
+STREAM_PREFIX = "run_logs:"
+STREAM_MAXLEN = int(os.getenv("RUN_LOG_STREAM_MAXLEN", "5000"))
+# Keep finished streams around long enough for late subscribers to catch the tail.
+STREAM_TTL_SECONDS = int(os.getenv("RUN_LOG_STREAM_TTL", "3600"))
+
+END_EVENT = "end"
+
+
+def stream_key(run_id: str) -> str:
+    return f"{STREAM_PREFIX}{run_id}"
+
+
+class RunLogPublisher:
+    """
+    Publishes each script output line to `run_logs:<run_id>` (Redis Stream).
+
+    Best effort: if Redis is unreachable the publisher disables itself after
+    the first failure so the stdout loop never pays repeated connect timeouts.
+    """
+
+    def __init__(self, run_id: str, redis_url: str = REDIS_URL):
+        self.run_id = run_id
+        self.key = stream_key(run_id)
+        self.enabled = True
+        try:
+            self.client = redis.Redis.from_url(redis_url, socket_connect_timeout=1, socket_timeout=1)
+        except Exception as e:
+            print(f"[LogStream] Redis unavailable, live streaming disabled: {e}")
+            self.enabled = False
+
+    def publish(self, line: str, event_type: str = "SCRIPT_OUTPUT"):
+        self._xadd({
+            "event_type": event_type,
+            "timestamp": datetime.utcnow().isoformat(),
+            "data": json.dumps({"stdout": line.strip()}),
+        })
+
+    def close(self, status: str):
+        """Append the end-of-run marker and start the retention clock."""
+        self._xadd({
+            "event_type": END_EVENT,
+            "timestamp": datetime.utcnow().isoformat(),
+            "data": json.dumps({"status": status}),
+        })
+        if self.enabled:
+            try:
+                self.client.expire(self.key, STREAM_TTL_SECONDS)
+            except Exception:
+                pass
+
+    def _xadd(self, fields):
+        if not self.enabled:
+            return
+        try:
+            self.client.xadd(self.key, fields, maxlen=STREAM_MAXLEN, approximate=True)
+        except Exception as e:
+            print(f"[LogStream] Publish failed, live streaming disabled for {self.run_id}: {e}")
+            self.enabled = False
+
+
+def format_sse(event_id: Optional[str], event: str, data: str) -> str:
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def tail_run_stream(run_id: str, last_event_id: Optional[str], request=None,
+                          block_ms: int = 15000, redis_url: str = REDIS_URL):
+    """
+    Async generator of SSE frames for a run, starting after `last_event_id`
+    (Redis stream id, e.g. "1700000000000-0"; None/"0" = from the start of the
+    retained window). Emits a keep-alive comment whenever XREAD times out and
+    stops after the end-of-run marker or when the client disconnects.
+    """
+    import redis.asyncio as aioredis
+
+    client = aioredis.Redis.from_url(redis_url, decode_responses=True)
+    key = stream_key(run_id)
+    cursor = last_event_id or "0-0"
+    try:
+        while True:
+            if request is not None and await request.is_disconnected():
+                return
+
+            try:
+                response = await client.xread({key: cursor}, count=500, block=block_ms)
+            except Exception as e:
+                # Client should fall back to polling GET /api/runs/{run_id}
+                print(f"[LogStream] Tail failed for {run_id}: {e}")
+                yield format_sse(None, "error", json.dumps({"message": "Live stream unavailable"}))
+                return
+            if not response:
+                yield ": keep-alive\n\n"
+                continue
+
+            for _, entries in response:
+                for entry_id, fields in entries:
+                    cursor = entry_id
+                    event_type = fields.get("event_type", "SCRIPT_OUTPUT")
+                    if event_type == END_EVENT:
+                        yield format_sse(entry_id, END_EVENT, fields.get("data", "{}"))
+                        return
+                    payload = json.dumps({
+                        "event_type": event_type,
+                        "timestamp": fields.get("timestamp"),
+                        "data": json.loads(fields.get("data", "{}")),
+                    })
+                    yield format_sse(entry_id, "log", payload)
+    finally:
+        await client.aclose()
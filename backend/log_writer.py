@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+
+from backend.database import SessionLocal
+from backend.models import Log
+
+# Flush thresholds: whichever is hit first triggers a bulk insert.
+DEFAULT_MAX_LINES = 500
+DEFAULT_MAX_INTERVAL = 0.25  # seconds
+
+
+class BufferedLogWriter:
+    """
+    Collects script output lines and bulk-inserts them into `logs`.
+
+    The stdout reader only appends to an in-memory buffer; a background thread
+    owns its own DB session and writes one multi-row INSERT (+ one commit) per
+    batch. This keeps a chatty child process from stalling on a full pipe while
+    Postgres acknowledges one commit per line.
+
+    Always use as a context manager (or call close()) so the tail is flushed
+    on exit or error.
+    """
+
+    def __init__(self, run_id: str, session_factory=SessionLocal,
+                 max_lines: int = DEFAULT_MAX_LINES, max_interval: float = DEFAULT_MAX_INTERVAL):
+        self.run_id = run_id
+        self.session_factory = session_factory
+        self.max_lines = max_lines
+        self.max_interval = max_interval
+
+        self._buffer: List[Dict] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.lines_written = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"log-writer-{self.run_id}", daemon=True)
+            self._thread.start()
+
+    def write(self, line: str, event_type: str = "SCRIPT_OUTPUT", data: Optional[Dict] = None):
+        row = {
+            "run_id": self.run_id,
+            "timestamp": datetime.utcnow().isoformat(),
+            "event_type": event_type,
+            "data": json.dumps(data if data is not None else {"stdout": line.strip()}),
+        }
+        with self._cond:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.max_lines:
+                self._cond.notify()
+
+    def flush(self):
+        """Synchronously write whatever is buffered (safe to call from any thread)."""
+        with self._cond:
+            batch, self._buffer = self._buffer, []
+        self._insert(batch)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # Catch anything written after the thread exited (or if it never started)
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.max_interval
+                while not self._closed and len(self._buffer) < self.max_lines:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._buffer = self._buffer, []
+                closed = self._closed
+            self._insert(batch)
+            if closed:
+                return
+
+    def _insert(self, batch: List[Dict]):
+        if not batch:
+            return
+        db = self.session_factory()
+        try:
+            db.execute(insert(Log), batch)
+            db.commit()
+            self.lines_written += len(batch)
+        except Exception as e:
+            db.rollback()
+            print(f"Log DB Error ({len(batch)} lines dropped): {e}")
+        finally:
+            db.close()
@@ -11,16 +11,28 @@ ADMIN_KEY = os.getenv("ADMIN_KEY")
 
 from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from sqlalchemy import select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import List, Dict, Optional, Any
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Any, Union
 from pydantic import BaseModel
 
 # Internal Imports
-from backend.database import SessionLocal, engine, Base
-from backend.models import Run, Log
+from backend.database import SessionLocal, engine, Base, get_async_db, parse_legacy_timestamp
+from backend.models import Run, Log, StepStat, utc_now, run_metadata_from_args
 from backend.tasks import run_script_task
-from backend.celery_app import celery_app
+from backend.celery_app import celery_app, QUEUE_PAID
+from backend.run_cache import cached_runs_response, bump_runs_version, bump_runs_version_async
+from backend.credentials import resolve_env_vars, resolve_env_vars_async, invalidate_credentials
+from backend.ingest import ingest_runs, ingest_logs, ingest_step_stats, normalize_status, MAX_INGEST_BATCH
+from backend.step_stats import summarize_steps
+from backend.tracing import (
+    span, current_traceparent, load_trace, build_timeline, render_timeline,
+    parse_traceparent, SPAN_KIND_SERVER, SPAN_KIND_CLIENT
+)
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
@@ -51,8 +63,47 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["traceparent"],
 )
 
+# Requests that start or change jobs are traced (backend.tracing); reads and the
+# high-volume ingestion routes are not.
+UNTRACED_PATHS = ("/api/logs", "/api/steps/stats", "/api/runs")
+
+class TraceRequestsMiddleware:
+    """
+    Plain ASGI middleware (not @app.middleware / BaseHTTPMiddleware): requests
+    that aren't traced, including SSE streams and streaming exports, go
+    straight to the app untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT") or scope["path"] in UNTRACED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        parent = dict(scope["headers"]).get(b"traceparent", b"").decode("latin-1") or None
+        with span(f"{method} {path}", parent=parent, kind=SPAN_KIND_SERVER,
+                  **{"http.method": method, "http.target": path}) as s:
+            async def send_traced(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    s.set("http.status_code", status)
+                    if status >= 500:
+                        s.error(f"HTTP {status}")
+                    if s.traceparent:
+                        message = dict(message, headers=list(message.get("headers", [])) + [
+                            (b"traceparent", s.traceparent.encode("latin-1"))
+                        ])
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
+
+app.add_middleware(TraceRequestsMiddleware)
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -126,6 +177,12 @@ async def shutdown_event():
         await app.state.bot_app.stop()
         await app.state.bot_app.shutdown()
 
+    from backend.database import async_engine
+    await async_engine.dispose()
+
+    from backend.provider_checks import close_client
+    await close_client()
+
 # --- Models (Pydantic) ---
 
 class ScriptExecutionRequest(BaseModel):
@@ -136,8 +193,12 @@ class ScriptExecutionRequest(BaseModel):
 class RunStart(BaseModel):
     run_id: str
     script_name: str
-    status: str
-    start_time: str
+    status: Optional[str] = "RUNNING"
+    start_time: Optional[str] = None
+
+class RunUpdate(BaseModel):
+    status: Optional[str] = None
+    end_time: Optional[str] = None
 
 class LeadGenRequest(BaseModel):
     url: str
@@ -149,6 +210,13 @@ class LogEntry(BaseModel):
     timestamp: str
     event_type: str
     data: Dict[str, Any] # Recieved as JSON dict
+    event_id: Optional[str] = None # Client-generated; makes retries idempotent
+
+class StepStatsFlush(BaseModel):
+    flush_id: str
+    run_id: Optional[str] = None
+    script_name: str
+    steps: Dict[str, Dict[str, Any]] # step name -> backend.step_stats.StepAggregate.to_dict()
 
 from typing import Any
 
@@ -158,81 +226,373 @@ from typing import Any
 def health_check():
     return {"status": "ok", "service": "sipes-automation-backend-v2"}
 
+@app.get("/api/health/db")
+async def db_health_check(db: AsyncSession = Depends(get_async_db)):
+    """Round-trip latency plus pool usage for the API (async) and worker-side (sync) engines."""
+    import time
+    from sqlalchemy import text
+    from backend.database import async_engine, pool_stats
+
+    started = time.perf_counter()
+    try:
+        await db.execute(text("SELECT 1"))
+        status = "ok"
+        error = None
+    except Exception as e:
+        status = "error"
+        error = str(e)
+    latency_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    body = {
+        "status": status,
+        "latency_ms": latency_ms,
+        "backend": async_engine.dialect.name,
+        "pool": pool_stats(async_engine),
+        "sync_pool": pool_stats(engine),
+    }
+    if error:
+        body["error"] = error
+        # Non-2xx so load balancers and uptime checks see the database as down
+        return JSONResponse(status_code=503, content=body)
+    if async_engine.dialect.name == "sqlite":
+        body["journal_mode"] = (await db.execute(text("PRAGMA journal_mode"))).scalar()
+    return body
+
 @app.get("/api/runs")
-def list_runs(limit: int = 50, db: Session = Depends(get_db)):
-    runs = db.query(Run).order_by(Run.start_time.desc()).limit(limit).all()
-    return {"runs": runs}
+async def list_runs(request: Request, limit: int = 50, status: Optional[str] = None,
+                    db: AsyncSession = Depends(get_async_db)):
+    async def build():
+        query = select(Run)
+        if status:
+            query = query.where(Run.status == status)
+        runs = (await db.execute(query.order_by(Run.start_time.desc()).limit(limit))).scalars().all()
+        return {"runs": runs}
+
+    # ETag / 304 + in-process cache keyed on the runs change counter
+    return await cached_runs_response(request, build)
+
+MAX_ADMIN_PAGE = 500
+
+# Plain column rows (no ORM object per run) plus the SQL-computed duration
+ADMIN_RUN_COLUMNS = [c for c in Run.__table__.columns] + [Run.duration_seconds]
+
+# Runs whose legacy start_time couldn't be migrated (NULL) sort after all others
+NULL_START_CURSOR = "null"
+
+def format_run_cursor(start_time, run_id: str) -> str:
+    """(start_time, run_id) -> '<UTC ISO with Z>,<run_id>': no '+', so it survives an unencoded query string."""
+    from backend.database import parse_legacy_timestamp
+    if start_time is None:
+        return f"{NULL_START_CURSOR},{run_id}"
+    return f"{parse_legacy_timestamp(start_time).strftime('%Y-%m-%dT%H:%M:%S.%fZ')},{run_id}"
+
+def parse_run_cursor(cursor: str):
+    """'<start_time ISO>,<run_id>' (or 'null,<run_id>') -> (aware datetime or None, run_id)."""
+    from backend.database import parse_legacy_timestamp
+    start_time, _, run_id = cursor.partition(",")
+    if start_time == NULL_START_CURSOR and run_id:
+        return None, run_id
+    # Older '+00:00' cursors arrive with the '+' decoded to a space
+    if len(start_time) > 6 and start_time[-6] == " " and start_time[-3] == ":":
+        start_time = start_time[:-6] + "+" + start_time[-5:]
+    parsed = parse_legacy_timestamp(start_time)
+    if parsed is None or not run_id:
+        raise HTTPException(status_code=400, detail="Invalid cursor, expected before=<start_time>,<run_id>")
+    return parsed, run_id
 
 @app.get("/api/admin/runs")
-def list_admin_runs(admin_key: Optional[str] = None, limit: int = 100, db: Session = Depends(get_db)):
+async def list_admin_runs(request: Request, admin_key: Optional[str] = None, limit: int = 100,
+                          status: Optional[str] = None, email: Optional[str] = None, before: Optional[str] = None,
+                          db: AsyncSession = Depends(get_async_db)):
+    """
+    Newest-first keyset pages: pass the returned `next_before` as `before`
+    to get the next page (served by ix_runs_start_time_run_id, no OFFSET).
+    """
     # Basic Security (Optional but recommended)
     # env_admin_key = os.getenv("ADMIN_KEY")
     # if env_admin_key and admin_key != env_admin_key:
     #    raise HTTPException(status_code=403, detail="Unauthorized")
 
-    runs = db.query(Run).order_by(Run.start_time.desc()).limit(limit).all()
-    
-    # Enrich with parsed args for easy frontend display
-    enriched_runs = []
-    for r in runs:
-        run_dict = r.__dict__.copy()
-        run_dict.pop("_sa_instance_state", None)
+    limit = max(1, min(limit, MAX_ADMIN_PAGE))
+    cursor = parse_run_cursor(before) if before else None
+
+    async def build():
+        query = select(*ADMIN_RUN_COLUMNS)
+        if status:
+            query = query.where(Run.status == status)
+        if email:
+            query = query.where(Run.email == email)
+        if cursor:
+            before_time, before_run_id = cursor
+            if before_time is None:
+                query = query.where(Run.start_time.is_(None), Run.run_id < before_run_id)
+            else:
+                query = query.where(or_(
+                    Run.start_time < before_time,
+                    and_(Run.start_time == before_time, Run.run_id < before_run_id),
+                    Run.start_time.is_(None),
+                ))
+        query = query.order_by(Run.start_time.desc().nulls_last(), Run.run_id.desc()).limit(limit + 1)
+        rows = (await db.execute(query)).mappings().all()
+
+        has_more = len(rows) > limit
+        enriched_runs = []
+        for row in rows[:limit]:
+            run_dict = dict(row)
+            # Same shape the dashboard used to get from parsing args
+            meta = {}
+            if row["email"] is not None: meta['email'] = row["email"]
+            if row["lead_limit"] is not None: meta['limit'] = str(row["lead_limit"])
+            if row["url"] is not None: meta['url'] = row["url"]
+            run_dict['meta'] = meta
+            enriched_runs.append(run_dict)
+
+        next_before = None
+        if has_more:
+            last = enriched_runs[-1]
+            next_before = format_run_cursor(last["start_time"], last["run_id"])
+
+        return {"runs": enriched_runs, "next_before": next_before, "has_more": has_more}
+
+    return await cached_runs_response(request, build)
+
+@app.get("/api/runs/lookup")
+async def lookup_run(session_id: str, db: AsyncSession = Depends(get_async_db)):
+    # Index probe on runs.stripe_session_id. Declared before /api/runs/{run_id}
+    # so "lookup" isn't captured as a run id.
+    run = (await db.execute(select(Run.run_id).where(Run.stripe_session_id == session_id).limit(1))).first()
+
+    if run:
+        return {"run_id": run.run_id}
         
-        # Parse Args to extract useful metadata
-        meta = {}
+    raise HTTPException(status_code=404, detail="Run not found for this session")
+
+DEFAULT_LOG_PAGE = 200
+MAX_LOG_PAGE = 1000
+
+def fetch_log_page(db: Session, run_id: str, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                   limit: Optional[int] = None, event_type: Optional[str] = None):
+    """
+    Keyset page of a run's logs (served by the (run_id, id) index).
+
+    - after_id:  logs with id > after_id, oldest first (tailing forwards)
+    - before_id: logs with id < before_id (paging backwards through history)
+    - neither:   the most recent `limit` logs, or the full history without a
+                 limit (what the dashboard pages expect)
+    Rows are always returned in ascending id order. Compacted runs are served
+    from their run_log_archives blob with the same cursor semantics.
+    """
+    from backend.log_archive import load_archived_logs, page_rows
+
+    full_history = limit is None and after_id is None and before_id is None
+    limit = max(1, min(limit or DEFAULT_LOG_PAGE, MAX_LOG_PAGE))
+    query = db.query(Log.id, Log.timestamp, Log.event_type, Log.data).filter(Log.run_id == run_id)
+    if event_type:
+        query = query.filter(Log.event_type == event_type)
+
+    archived = load_archived_logs(db, run_id)
+    if archived is not None:
+        # Archive plus the few rows compaction leaves in place
+        live = [{"id": r.id, "timestamp": r.timestamp, "event_type": r.event_type, "data": r.data}
+                for r in query.order_by(Log.id.asc()).all()]
+        merged = sorted(archived + live, key=lambda r: r["id"]) if live else archived
+        page, has_more = page_rows(merged, after_id, before_id, len(merged) if full_history else limit, event_type)
+        rows = [(r["id"], r["timestamp"], r["event_type"], r["data"]) for r in page]
+    elif full_history:
+        rows = query.order_by(Log.id.asc()).all()
+        has_more = False
+    elif after_id is not None:
+        rows = query.filter(Log.id > after_id).order_by(Log.id.asc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        if before_id is not None:
+            query = query.filter(Log.id < before_id)
+        rows = query.order_by(Log.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+
+    logs_data = []
+    for log_id, timestamp, log_event_type, data in rows:
         try:
-            if r.args:
-                args = json.loads(r.args)
-                # args is list ["--url", "...", "--email", "..."]
-                if "--email" in args:
-                    meta['email'] = args[args.index("--email") + 1]
-                if "--limit" in args:
-                    meta['limit'] = args[args.index("--limit") + 1]
-                if "--url" in args:
-                    meta['url'] = args[args.index("--url") + 1]
-        except: pass
-        
-        run_dict['meta'] = meta
-        enriched_runs.append(run_dict)
+            data = json.loads(data) if data else data
+        except Exception: pass
+        logs_data.append({
+            "id": log_id,
+            "run_id": run_id,
+            "timestamp": timestamp,
+            "event_type": log_event_type,
+            "data": data
+        })
 
-    return {"runs": enriched_runs}
+    return {
+        "logs": logs_data,
+        # Cursors: pass `before_id` to go further back, `after_id` to poll for new lines
+        "before_id": logs_data[0]["id"] if logs_data else before_id,
+        "after_id": logs_data[-1]["id"] if logs_data else after_id,
+        "has_more": has_more
+    }
 
 @app.get("/api/runs/{run_id}")
-def get_run_details(run_id: str, db: Session = Depends(get_db)):
-    run = db.query(Run).filter(Run.run_id == run_id).first()
+async def get_run_details(run_id: str, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                          limit: Optional[int] = None, event_type: Optional[str] = None,
+                          include_logs: bool = True, db: AsyncSession = Depends(get_async_db)):
+    run = await db.get(Run, run_id)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
-    
-    # Use ORM relationship, but sort logs?
-    # relationship logs is unordered usually unless defined.
-    # explicit query is safer for sorting
-    logs = db.query(Log).filter(Log.run_id == run_id).order_by(Log.id.asc()).all()
-    
-    # Parse log data from JSON string to dict for response
-    logs_data = []
-    for l in logs:
-        log_dict = l.__dict__.copy()
-        if "data" in log_dict and isinstance(log_dict["data"], str):
-             try:
-                 log_dict["data"] = json.loads(log_dict["data"])
-             except: pass
-        # Remove SQLAlchemy internal state
-        log_dict.pop("_sa_instance_state", None)
-        logs_data.append(log_dict)
 
-    return {
-        "run": run,
-        "logs": logs_data
-    }
+    from backend.run_results import get_result
+    result = await db.run_sync(lambda s: get_result(s, run_id))
+
+    # Waiting behind the workspace's concurrency cap?
+    position = None
+    if run.status == "QUEUED":
+        from backend.concurrency import queue_position, workspace_for_args
+        workspace_id = workspace_for_args(run.args)
+        if workspace_id:
+            position = await run_in_threadpool(queue_position, workspace_id, run_id)
+
+    if not include_logs:
+        return {"run": run, "result": result, "queue_position": position}
+
+    page = await db.run_sync(lambda s: fetch_log_page(s, run_id, after_id, before_id, limit, event_type))
+    return {"run": run, "result": result, "queue_position": position, **page}
+
+@app.get("/api/runs/{run_id}/logs")
+async def get_run_logs(run_id: str, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                       limit: Optional[int] = None, event_type: Optional[str] = None,
+                       db: AsyncSession = Depends(get_async_db)):
+    """Logs only, without run metadata. See fetch_log_page for cursor semantics."""
+    return await db.run_sync(lambda s: fetch_log_page(s, run_id, after_id, before_id, limit, event_type))
+
+@app.get("/api/runs/{run_id}/stream")
+async def stream_run_logs(run_id: str, request: Request, last_event_id: Optional[str] = None,
+                          db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-Sent Events tail of a run's output, backed by the Redis Stream that
+    run_script_task publishes to. Resumes after `Last-Event-ID` (sent by
+    EventSource on reconnect) or the `last_event_id` query param.
+    """
+    from backend.log_stream import tail_run_stream, format_sse, stream_key
+    from backend.celery_app import REDIS_URL
+    import redis.asyncio as aioredis
+
+    status = (await db.execute(select(Run.status).where(Run.run_id == run_id))).scalar_one_or_none()
+    if status is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    # Release the connection before the long-lived tail starts
+    await db.close()
+
+    cursor = request.headers.get("last-event-id") or last_event_id
+
+    # Finished run whose stream already expired: nothing to tail, tell the
+    # client to fall back to GET /api/runs/{run_id}.
+    if status in ("COMPLETED", "FAILED", "ERROR", "STALLED"):
+        client = aioredis.Redis.from_url(REDIS_URL)
+        try:
+            exists = await client.exists(stream_key(run_id))
+        except Exception:
+            exists = False
+        finally:
+            await client.aclose()
+        if not exists:
+            async def finished():
+                yield format_sse(None, "end", json.dumps({"status": status}))
+            return StreamingResponse(finished(), media_type="text/event-stream")
+
+    return StreamingResponse(
+        tail_run_stream(run_id, cursor, request=request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/api/runs/{run_id}/leads")
-def get_run_leads(run_id: str, db: Session = Depends(get_db)):
+async def get_run_leads(run_id: str, format: str = "json", fields: Optional[str] = None,
+                        db: AsyncSession = Depends(get_async_db)):
+    """
+    format=json (default) returns {"leads": [...]} in one response;
+    format=csv / ndjson stream through a server-side cursor with chunked
+    transfer. `fields` (comma-separated) projects columns, e.g. to skip raw_data.
+    """
     from backend.models import Lead
-    leads = db.query(Lead).filter(Lead.run_id == run_id).all()
-    return {"leads": leads}
+    from backend.lead_export import EXPORT_FORMATS, parse_fields, stream_leads
+
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    columns = parse_fields(fields)
+
+    if format == "json":
+        if not fields:
+            leads = (await db.execute(select(Lead).where(Lead.run_id == run_id))).scalars().all()
+            return {"leads": leads}
+        query = select(*[getattr(Lead, c) for c in columns]).where(Lead.run_id == run_id).order_by(Lead.id)
+        return {"leads": [dict(row) for row in (await db.execute(query)).mappings()]}
+
+    if (await db.execute(select(Run.run_id).where(Run.run_id == run_id))).first() is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    # The stream opens its own session; don't hold this one for the whole download
+    await db.close()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_leads(run_id, columns, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="leads_{run_id}.{format}"'}
+    )
+
+@app.get("/api/runs/{run_id}/trace")
+async def get_run_trace(run_id: str, format: str = "json", db: AsyncSession = Depends(get_async_db)):
+    """
+    Flame-style timeline of the run's trace (API request, webhook, Celery task,
+    script, provider calls, DB commits) from the local OTLP JSON export.
+    format=text returns a plain-text chart.
+    """
+    traceparent = (await db.execute(select(Run.traceparent).where(Run.run_id == run_id))).scalar_one_or_none()
+    context = parse_traceparent(traceparent)
+    if context is None:
+        raise HTTPException(status_code=404, detail="No trace recorded for this run")
+    await db.close()
+
+    timeline = build_timeline(await run_in_threadpool(load_trace, context[0]))
+    if format == "text":
+        return PlainTextResponse(render_timeline(timeline))
+    return {"run_id": run_id, "trace_id": context[0], "spans": timeline}
+
+# --- Ingestion (backend.instrumentation) ---
+# Single objects or arrays; each array is stored with one multi-row INSERT.
+
+def _as_batch(body) -> List[Dict]:
+    items = body if isinstance(body, list) else [body]
+    if len(items) > MAX_INGEST_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_INGEST_BATCH} items per request")
+    return [item.model_dump() for item in items]
+
+@app.post("/api/runs")
+async def register_runs(body: Union[List[RunStart], RunStart], db: AsyncSession = Depends(get_async_db)):
+    result = await ingest_runs(db, _as_batch(body))
+    if result["created"]:
+        await bump_runs_version_async()
+    return result
+
+@app.put("/api/runs/{run_id}")
+async def update_run(run_id: str, update: RunUpdate, db: AsyncSession = Depends(get_async_db)):
+    run = await db.get(Run, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if update.status:
+        run.status = normalize_status(update.status)
+    if update.end_time or (update.status and run.status not in ("RUNNING", "QUEUED")):
+        run.end_time = parse_legacy_timestamp(update.end_time) or utc_now()
+    await db.commit()
+    await bump_runs_version_async()
+    return {"status": "ok", "run_id": run_id}
+
+@app.post("/api/logs")
+async def ingest_log_events(body: Union[List[LogEntry], LogEntry], db: AsyncSession = Depends(get_async_db)):
+    return await ingest_logs(db, _as_batch(body))
 
 @app.post("/api/execute")
-async def execute_script(request: ScriptExecutionRequest, db: Session = Depends(get_db)):
+async def execute_script(request: ScriptExecutionRequest, db: AsyncSession = Depends(get_async_db)):
     run_id = str(uuid.uuid4())
     
     # Create Run in DB
@@ -240,50 +600,48 @@ async def execute_script(request: ScriptExecutionRequest, db: Session = Depends(
         run_id=run_id,
         script_name=request.script_name,
         status="QUEUED",
-        start_time=datetime.utcnow().isoformat(),
+        start_time=utc_now(),
         args=json.dumps(request.args),
-        env_vars=json.dumps(request.env_vars)
+        **run_metadata_from_args(request.args),
+        env_vars=json.dumps(request.env_vars),
+        traceparent=current_traceparent()
     )
     db.add(new_run)
-    db.commit()
+    await db.commit()
+    await bump_runs_version_async()
     
-    # Dispatch to Celery
-    run_script_task.delay(request.script_name, request.args, request.env_vars, run_id)
+    # Dispatch to Celery (broker publish is blocking I/O, keep it off the event loop)
+    await run_in_threadpool(run_script_task.delay, request.script_name, request.args, request.env_vars, run_id)
     
     return {"status": "queued", "run_id": run_id}
 
 @app.post("/api/leads/process-url")
-def process_apollo_url(request: LeadGenRequest, db: Session = Depends(get_db)):
+async def process_apollo_url(request: LeadGenRequest, db: AsyncSession = Depends(get_async_db)):
     if not request.url or not request.email:
          raise HTTPException(status_code=400, detail="URL and Email are required")
 
     run_id = str(uuid.uuid4())
     args = ["--url", request.url, "--email", request.email, "--limit", str(request.limit)]
     
-    # Fetch Workspace Keys
-    from backend.models import WorkspaceConfig
-    config = db.query(WorkspaceConfig).filter(WorkspaceConfig.workspace_id == request.email).first()
-    
-    env_vars = {}
-    if config:
-        if config.apollo_api_key: env_vars['APOLLO_API_KEY'] = config.apollo_api_key
-        if config.blitz_api_key: env_vars['BLITZ_API_KEY'] = config.blitz_api_key
-        if config.million_verifier_api_key: env_vars['MILLION_VERIFIER_API_KEY'] = config.million_verifier_api_key
-        if config.smartlead_api_key: env_vars['SMARTLEAD_API_KEY'] = config.smartlead_api_key
+    # Fetch Workspace Keys (cached, see backend.credentials)
+    env_vars = await resolve_env_vars_async(db, request.email)
     
     new_run = Run(
         run_id=run_id,
         script_name="lead_gen_orchestrator.py",
         status="QUEUED",
-        start_time=datetime.utcnow().isoformat(),
+        start_time=utc_now(),
         args=json.dumps(args),
-        env_vars=json.dumps(env_vars)
+        **run_metadata_from_args(args),
+        env_vars=json.dumps(env_vars),
+        traceparent=current_traceparent()
     )
     db.add(new_run)
-    db.commit()
+    await db.commit()
+    await bump_runs_version_async()
 
     # Dispatch
-    run_script_task.delay("lead_gen_orchestrator.py", args, env_vars, run_id)
+    await run_in_threadpool(run_script_task.delay, "lead_gen_orchestrator.py", args, env_vars, run_id)
 
     return {"status": "queued", "job": "lead_gen_orchestrator", "run_id": run_id}
 
@@ -294,13 +652,14 @@ class ConfigUpdate(BaseModel):
     blitz_api_key: Optional[str] = None
     million_verifier_api_key: Optional[str] = None
     smartlead_api_key: Optional[str] = None
+    max_concurrent_runs: Optional[int] = None
 
 @app.post("/api/config")
-def update_config(config: ConfigUpdate, db: Session = Depends(get_db)):
+async def update_config(config: ConfigUpdate, db: AsyncSession = Depends(get_async_db)):
     from backend.models import WorkspaceConfig
     
     # Upsert logic
-    existing = db.query(WorkspaceConfig).filter(WorkspaceConfig.workspace_id == config.workspace_id).first()
+    existing = await db.get(WorkspaceConfig, config.workspace_id)
     
     if not existing:
         existing = WorkspaceConfig(workspace_id=config.workspace_id)
@@ -310,14 +669,17 @@ def update_config(config: ConfigUpdate, db: Session = Depends(get_db)):
     if config.blitz_api_key is not None: existing.blitz_api_key = config.blitz_api_key
     if config.million_verifier_api_key is not None: existing.million_verifier_api_key = config.million_verifier_api_key
     if config.smartlead_api_key is not None: existing.smartlead_api_key = config.smartlead_api_key
+    if config.max_concurrent_runs is not None: existing.max_concurrent_runs = config.max_concurrent_runs or None
     
-    db.commit()
+    await db.commit()
+    # Drop cached keys in this and every other API / worker process
+    await run_in_threadpool(invalidate_credentials, config.workspace_id)
     return {"status": "updated"}
 
 @app.get("/api/config/{workspace_id}")
-def get_config(workspace_id: str, db: Session = Depends(get_db)):
+async def get_config(workspace_id: str, db: AsyncSession = Depends(get_async_db)):
     from backend.models import WorkspaceConfig
-    config = db.query(WorkspaceConfig).filter(WorkspaceConfig.workspace_id == workspace_id).first()
+    config = await db.get(WorkspaceConfig, workspace_id)
     
     if not config:
         return {}
@@ -335,60 +697,28 @@ def get_config(workspace_id: str, db: Session = Depends(get_db)):
         "has_apollo": bool(config.apollo_api_key),
         "has_blitz": bool(config.blitz_api_key),
         "has_million_verifier": bool(config.million_verifier_api_key),
-        "has_smartlead": bool(config.smartlead_api_key)
+        "has_smartlead": bool(config.smartlead_api_key),
+        "max_concurrent_runs": config.max_concurrent_runs
     }
 
 class TestConfigRequest(BaseModel):
-    service: str # apollo, blitz, million_verifier
-    api_key: str
+    service: Optional[str] = None # apollo, blitz, million_verifier
+    api_key: Optional[str] = None
+    # Several services at once, checked concurrently: {"apollo": "...", "blitz": "..."}
+    keys: Optional[Dict[str, str]] = None
 
 @app.post("/api/config/test")
-def test_config(req: TestConfigRequest):
-    import requests
-    
-    try:
-        if req.service == 'apollo':
-            # Simple health check endpoint for Apollo usually involves a small search or auth check
-            resp = requests.post("https://api.apollo.io/v1/auth/health", headers={
-                "Content-Type": "application/json",
-                "X-Api-Key": req.api_key
-            }, timeout=5)
-            # Apollo health check usually returns 200 and { is_logged_in: true } if valid
-            # Or we can just try a search with page 1 limit 1
-            if resp.status_code == 200: return {"status": "ok"}
-            # Fallback test: search
-            resp = requests.post("https://api.apollo.io/v1/mixed_people/search", headers={
-                "Content-Type": "application/json",
-                "X-Api-Key": req.api_key
-            }, json={"page": 1, "per_page": 1}, timeout=5)
-            if resp.status_code == 200: return {"status": "ok"}
-            return {"status": "error", "message": f"Apollo API Error: {resp.status_code}"}
-
-        elif req.service == 'blitz':
-            # Blitz usually needs a query to verify, or returns 401
-            # We can try enriching a dummy LinkedIn
-            resp = requests.post("https://api.blitz-api.ai/api/enrichment/email", headers={
-                 "Content-Type": "application/json",
-                 "x-api-key": req.api_key
-            }, json={"linkedin_profile_url": "https://linkedin.com/in/williamhgates"}, timeout=5)
-            
-            if resp.status_code == 200 or resp.status_code == 429: return {"status": "ok"} # 429 means key works but rate limited
-            if resp.status_code == 401 or resp.status_code == 403: return {"status": "error", "message": "Invalid API Key"}
-            return {"status": "ok"} # Other errors might be credits, but key is likely fine if not 401
-
-        elif req.service == 'million_verifier':
-             # https://api.millionverifier.com/api/v3/credits?api_key=...
-             resp = requests.get(f"https://api.millionverifier.com/api/v3/credits?api_key={req.api_key}", timeout=5)
-             if resp.status_code == 200: return {"status": "ok"}
-             return {"status": "error", "message": "Invalid API Key"}
-             
-        return {"status": "error", "message": "Unknown Service"}
-        
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+async def test_config(req: TestConfigRequest):
+    from backend.provider_checks import check_key, check_keys
+
+    if req.keys:
+        return {"results": await check_keys(req.keys)}
+    if not req.service or not req.api_key:
+        raise HTTPException(status_code=400, detail="service and api_key (or keys) are required")
+    return await check_key(req.service, req.api_key)
 
 @app.post("/api/leads/test-run")
-async def start_test_run(req: Request, admin_key: str):
+async def start_test_run(req: Request, admin_key: str, db: AsyncSession = Depends(get_async_db)):
     import traceback
     try:
         if admin_key != ADMIN_KEY:
@@ -398,19 +728,20 @@ async def start_test_run(req: Request, admin_key: str):
         run_id = f"test_{uuid.uuid4()}"
         
         # Create DB Entry
-        db = next(get_db())
         try:
             new_run = Run(
                 run_id=run_id,
                 script_name="lead_gen_orchestrator.py",
                 status="submitting",
                 args=f"--mock", # Store that it was a mock
-                env_vars="{}"
+                env_vars="{}",
+                traceparent=current_traceparent()
             )
             db.add(new_run)
-            db.commit()
+            await db.commit()
+            await bump_runs_version_async()
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise Exception(f"DB Error: {str(e)}")
 
         # Launch Celery Task
@@ -420,7 +751,8 @@ async def start_test_run(req: Request, admin_key: str):
             safe_email = "test@example.com"
             print("WARNING: SENDER_EMAIL not set, using fallback.")
 
-        task = run_script_task.delay(
+        task = await run_in_threadpool(
+            run_script_task.delay,
             script_name="lead_gen_orchestrator.py",
             args=["--url", "mock", "--email", safe_email, "--limit", "5", "--mock"],
             env_vars={"RUN_ID": run_id, "DATABASE_URL": os.getenv("DATABASE_URL")},
@@ -436,14 +768,100 @@ async def start_test_run(req: Request, admin_key: str):
         raise HTTPException(status_code=500, detail=f"Backend Error: {str(e)}")
 
 @app.post("/api/leads/preview")
-def preview_leads(request: LeadGenRequest):
+async def preview_leads(request: LeadGenRequest):
     try:
-        from execution.lead_gen_orchestrator import get_preview_leads
-        leads = get_preview_leads(request.url)
+        # Cached by canonical search payload, coalesced, async per_page=10 fetch
+        from backend.lead_preview import get_preview
+        leads = await get_preview(request.url)
         return {"leads": leads}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- Metrics ---
+
+def percentile(sorted_values: List[float], pct: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    import math
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(values: List[float]):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1],
+        "avg": sum(values) / len(values)
+    }
+
+@app.get("/api/metrics/runs")
+async def run_metrics(script_name: Optional[str] = None, limit: int = 5000, db: AsyncSession = Depends(get_async_db)):
+    """
+    Resource usage per script_name (wall time, CPU, peak RSS, API calls) over
+    the most recent `limit` finished runs that have accounting data.
+    """
+    query = select(
+        Run.script_name, Run.wall_seconds, Run.cpu_user_seconds,
+        Run.cpu_system_seconds, Run.peak_rss_kb, Run.api_calls
+    ).where(Run.wall_seconds.isnot(None))
+    if script_name:
+        query = query.where(Run.script_name == script_name)
+    rows = (await db.execute(query.order_by(Run.start_time.desc()).limit(min(limit, 50000)))).all()
+
+    by_script: Dict[str, List] = {}
+    for row in rows:
+        by_script.setdefault(row.script_name, []).append(row)
+
+    scripts = []
+    for name, script_rows in by_script.items():
+        cpu_totals = [
+            (r.cpu_user_seconds or 0) + (r.cpu_system_seconds or 0)
+            for r in script_rows if r.cpu_user_seconds is not None
+        ]
+        scripts.append({
+            "script_name": name,
+            "runs": len(script_rows),
+            "wall_seconds": summarize([r.wall_seconds for r in script_rows]),
+            "cpu_seconds": summarize(cpu_totals),
+            "cpu_user_seconds_total": sum(r.cpu_user_seconds or 0 for r in script_rows),
+            "cpu_system_seconds_total": sum(r.cpu_system_seconds or 0 for r in script_rows),
+            "peak_rss_mb": summarize([r.peak_rss_kb / 1024 for r in script_rows if r.peak_rss_kb is not None]),
+            "api_calls": summarize([r.api_calls for r in script_rows])
+        })
+
+    # Most expensive scripts first
+    scripts.sort(key=lambda s: s["cpu_user_seconds_total"] + s["cpu_system_seconds_total"], reverse=True)
+    return {"scripts": scripts}
+
+@app.post("/api/steps/stats")
+async def ingest_step_stats_flush(flush: StepStatsFlush, db: AsyncSession = Depends(get_async_db)):
+    return await ingest_step_stats(db, flush.model_dump())
+
+@app.get("/api/steps/stats")
+async def step_stats(script: Optional[str] = None, run_id: Optional[str] = None, hours: float = 24 * 7,
+                     db: AsyncSession = Depends(get_async_db)):
+    """
+    Per-step durations (count, errors, total / mean / min / max, p50 / p95 /
+    p99 in ms) for a script and/or run over the last `hours`, slowest total first.
+    """
+    if not script and not run_id:
+        raise HTTPException(status_code=400, detail="script or run_id is required")
+    query = select(
+        StepStat.step_name, StepStat.count, StepStat.errors, StepStat.sum_ns,
+        StepStat.min_ns, StepStat.max_ns, StepStat.buckets
+    ).where(StepStat.flushed_at >= utc_now() - timedelta(hours=hours))
+    if script:
+        query = query.where(StepStat.script_name == script)
+    if run_id:
+        query = query.where(StepStat.run_id == run_id)
+    rows = (await db.execute(query)).mappings().all()
+    return {"script": script, "run_id": run_id, "steps": summarize_steps(rows)}
+
 # --- Stripe ---
 
 @app.post("/api/create-checkout-session")
@@ -462,56 +880,58 @@ def create_checkout_session(request: LeadGenRequest, db: Session = Depends(get_d
         args = ["--url", request.url, "--email", request.email, "--limit", str(limit)]
         
         # Fetch Workspace Keys (Stripe Flow)
-        from backend.models import WorkspaceConfig
-        config = db.query(WorkspaceConfig).filter(WorkspaceConfig.workspace_id == request.email).first()
-        
-        env_vars = {}
-        if config:
-            if config.apollo_api_key: env_vars['APOLLO_API_KEY'] = config.apollo_api_key
-            if config.blitz_api_key: env_vars['BLITZ_API_KEY'] = config.blitz_api_key
-            if config.million_verifier_api_key: env_vars['MILLION_VERIFIER_API_KEY'] = config.million_verifier_api_key
-            if config.smartlead_api_key: env_vars['SMARTLEAD_API_KEY'] = config.smartlead_api_key
+        env_vars = resolve_env_vars(db, request.email)
         
         new_run = Run(
             run_id=run_id,
             script_name="lead_gen_orchestrator.py",
             status="PENDING_PAYMENT",
-            start_time=datetime.utcnow().isoformat(),
+            start_time=utc_now(),
             args=json.dumps(args),
-            env_vars=json.dumps(env_vars)
+            **run_metadata_from_args(args),
+            env_vars=json.dumps(env_vars),
+            # The webhook continues this trace when payment lands
+            traceparent=current_traceparent()
         )
         db.add(new_run)
         db.commit()
+        bump_runs_version()
 
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'usd',
-                    'product_data': {
-                        'name': 'Apollo Lead Generation',
-                        'description': f'Scraping & Enriching {limit} leads',
+        with span("stripe.checkout.create", kind=SPAN_KIND_CLIENT):
+            checkout_session = stripe.checkout.Session.create(
+                payment_method_types=['card'],
+                line_items=[{
+                    'price_data': {
+                        'currency': 'usd',
+                        'product_data': {
+                            'name': 'Apollo Lead Generation',
+                            'description': f'Scraping & Enriching {limit} leads',
+                        },
+                        'unit_amount': price_cents,
                     },
-                    'unit_amount': price_cents,
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
-            success_url=f"{os.getenv('FRONTEND_URL', 'https://www.sipesautomation.com').rstrip('/')}/tools/lead-gen?success=true&session_id={{CHECKOUT_SESSION_ID}}&run_id={run_id}",
-            cancel_url=f"{os.getenv('FRONTEND_URL', 'https://www.sipesautomation.com').rstrip('/')}/tools/lead-gen?canceled=true",
-            metadata={
-                'run_id': run_id, # Pass reference instead of full data
-                'email': request.email, # Keep for quick reference in dashboard
-                'limit': str(limit)
-            }
-        )
+                    'quantity': 1,
+                }],
+                mode='payment',
+                success_url=f"{os.getenv('FRONTEND_URL', 'https://www.sipesautomation.com').rstrip('/')}/tools/lead-gen?success=true&session_id={{CHECKOUT_SESSION_ID}}&run_id={run_id}",
+                cancel_url=f"{os.getenv('FRONTEND_URL', 'https://www.sipesautomation.com').rstrip('/')}/tools/lead-gen?canceled=true",
+                metadata={
+                    'run_id': run_id, # Pass reference instead of full data
+                    'email': request.email, # Keep for quick reference in dashboard
+                    'limit': str(limit)
+                }
+            )
+        # Map session -> run up front so /api/runs/lookup works even before the webhook lands
+        new_run.stripe_session_id = checkout_session.id
+        db.commit()
+        bump_runs_version()
+
         return {"checkoutUrl": checkout_session.url}
     except Exception as e:
         print(f"Stripe Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/webhook/stripe")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     payload = await request.body()
     sig_header = request.headers.get('stripe-signature')
     endpoint_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
@@ -541,28 +961,32 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
         if run_id:
             print(f"[Stripe] Payment received for Run ID: {run_id}")
             # Find existing run
-            run = db.query(Run).filter(Run.run_id == run_id).first()
+            run = await db.get(Run, run_id)
             if run:
-                run.status = "QUEUED"
+                # Continue the checkout request's trace: the job's spans join it
+                with span("stripe.webhook.dispatch", parent=run.traceparent, **{"run.id": run_id}):
+                    run.status = "QUEUED"
+                    run.stripe_session_id = session['id']
                 
-                # Retrieve args from DB to dispatch
-                args = json.loads(run.args)
-                env_vars = json.loads(run.env_vars) if run.env_vars else {}
+                    # Retrieve args from DB to dispatch
+                    args = json.loads(run.args)
+                    env_vars = json.loads(run.env_vars) if run.env_vars else {}
                 
-                # Log Session ID
-                log_data = json.dumps({"session_id": session['id']})
-                new_log = Log(
-                    run_id=run_id,
-                    timestamp=datetime.utcnow().isoformat(),
-                    event_type="STRIPE_SESSION_ID",
-                    data=log_data
-                )
-                db.add(new_log)
-                db.commit()
+                    # Log Session ID
+                    log_data = json.dumps({"session_id": session['id']})
+                    new_log = Log(
+                        run_id=run_id,
+                        timestamp=datetime.utcnow().isoformat(),
+                        event_type="STRIPE_SESSION_ID",
+                        data=log_data
+                    )
+                    db.add(new_log)
+                    await db.commit()
+                    await bump_runs_version_async()
                 
-                # Dispatch
-                run_script_task.delay("lead_gen_orchestrator.py", args, env_vars, run_id)
-                print(f"[Stripe] Job Resumed: {run_id}")
+                    # Dispatch (paid jobs have their own queue)
+                    await run_in_threadpool(run_script_task.apply_async, ("lead_gen_orchestrator.py", args, env_vars, run_id), queue=QUEUE_PAID)
+                    print(f"[Stripe] Job Resumed: {run_id}")
             else:
                  print(f"[Stripe] Error: Run ID {run_id} not found in DB.")
 
@@ -572,25 +996,22 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
             args = ["--url", apollo_url, "--email", email, "--limit", str(limit or 100)]
             
             # Fetch Config for Legacy Flow too
-            from backend.models import WorkspaceConfig
-            config = db.query(WorkspaceConfig).filter(WorkspaceConfig.workspace_id == email).first()
-            env_vars = {}
-            if config:
-                if config.apollo_api_key: env_vars['APOLLO_API_KEY'] = config.apollo_api_key
-                if config.blitz_api_key: env_vars['BLITZ_API_KEY'] = config.blitz_api_key
-                if config.million_verifier_api_key: env_vars['MILLION_VERIFIER_API_KEY'] = config.million_verifier_api_key
+            env_vars = await resolve_env_vars_async(db, email)
             
             new_run = Run(
                 run_id=run_id,
                 script_name="lead_gen_orchestrator.py",
                 status="QUEUED",
-                start_time=datetime.utcnow().isoformat(),
+                start_time=utc_now(),
                 args=json.dumps(args),
-                env_vars=json.dumps(env_vars)
+                **run_metadata_from_args(args),
+                env_vars=json.dumps(env_vars),
+                stripe_session_id=session['id'],
+                traceparent=current_traceparent()
             )
             db.add(new_run)
             
-            # Log Session ID for lookup
+            # Log Session ID (audit trail; lookup uses runs.stripe_session_id)
             log_data = json.dumps({"session_id": session['id']})
             new_log = Log(
                 run_id=run_id,
@@ -599,30 +1020,16 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
                 data=log_data
             )
             db.add(new_log)
-            db.commit()
+            await db.commit()
+            await bump_runs_version_async()
             
-            # Dispatch
-            run_script_task.delay("lead_gen_orchestrator.py", args, env_vars, run_id)
+            # Dispatch (paid jobs have their own queue)
+            await run_in_threadpool(run_script_task.apply_async, ("lead_gen_orchestrator.py", args, env_vars, run_id), queue=QUEUE_PAID)
             
             print(f"[Stripe] Job queued: {run_id}")
 
     return {"status": "success"}
 
-@app.get("/api/runs/lookup")
-def lookup_run(session_id: str, db: Session = Depends(get_db)):
-    # Search logs for session_id
-    # Using ILIKE or similar for JSON text search implies full scan in PG unless indexed text search
-    # But volume is low.
-    log = db.query(Log).filter(
-        Log.event_type == 'STRIPE_SESSION_ID', 
-        Log.data.like(f'%"{session_id}"%')
-    ).first()
-    
-    if log:
-        return {"run_id": log.run_id}
-        
-    raise HTTPException(status_code=404, detail="Run not found for this session")
-
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
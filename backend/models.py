@@ -1,23 +1,92 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, JSON
-from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Text, ForeignKey, JSON, Index, Float, LargeBinary, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import relationship, column_property
+from sqlalchemy.sql.expression import FunctionElement
+from datetime import datetime, timezone
+import json
 from backend.database import Base
 
+def utc_now():
+    return datetime.now(timezone.utc)
+
+class seconds_between(FunctionElement):
+    """seconds_between(start, end): elapsed seconds computed by the database (NULL if either is NULL)."""
+    type = Float()
+    name = "seconds_between"
+    inherit_cache = True
+
+@compiles(seconds_between)
+def _seconds_between_default(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return "EXTRACT(EPOCH FROM (%s - %s))" % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+@compiles(seconds_between, "sqlite")
+def _seconds_between_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return "ROUND((julianday(%s) - julianday(%s)) * 86400.0, 3)" % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+def run_metadata_from_args(args):
+    """
+    email / url / lead_limit for the Run columns, pulled from the script's CLI
+    args (list or JSON string, e.g. ["--url", "...", "--email", "...", "--limit", "100"]).
+    """
+    meta = {"email": None, "url": None, "lead_limit": None}
+    if isinstance(args, str):
+        try:
+            args = json.loads(args)
+        except Exception:
+            return meta
+    if not isinstance(args, list):
+        return meta
+    for flag, key in (("--email", "email"), ("--url", "url"), ("--limit", "lead_limit")):
+        if flag in args and args.index(flag) + 1 < len(args):
+            meta[key] = args[args.index(flag) + 1]
+    try:
+        meta["lead_limit"] = int(meta["lead_limit"]) if meta["lead_limit"] is not None else None
+    except (TypeError, ValueError):
+        meta["lead_limit"] = None
+    return meta
+
 class Run(Base):
     __tablename__ = "runs"
 
     run_id = Column(String, primary_key=True, index=True)
     script_name = Column(String, index=True)
     status = Column(String, default="QUEUED")
-    start_time = Column(String) # Keeping as string to match old schema execution, or migrate to DateTime? 
-    # To keep migration simple, we'll keep as String (ISO format) for now, 
-    # but normally DateTime is better. Let's stick to String to avoid migration headaches with existing data format.
-    end_time = Column(String, nullable=True)
+    # UTC. Legacy ISO-string values are converted by database.migrate_run_timestamps.
+    start_time = Column(DateTime(timezone=True), default=utc_now)
+    end_time = Column(DateTime(timezone=True), nullable=True)
+    # Stamped by the worker while RUNNING; see backend.heartbeat
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    # Computed by the database on load; NULL while the run is still going
+    duration_seconds = column_property(seconds_between(start_time, end_time))
     args = Column(Text, nullable=True) # JSON Array string
     env_vars = Column(Text, nullable=True) # JSON Object string
+    stripe_session_id = Column(String, nullable=True, index=True) # Checkout session that paid for this run
+    traceparent = Column(String, nullable=True) # W3C trace context of the creating request (backend.tracing)
+
+    # Copied out of `args` at creation (run_metadata_from_args) for the admin list
+    email = Column(String, nullable=True, index=True)
+    url = Column(Text, nullable=True)
+    lead_limit = Column(Integer, nullable=True)
+
+    # Resource accounting for the script process (filled in when it exits)
+    wall_seconds = Column(Float, nullable=True)
+    cpu_user_seconds = Column(Float, nullable=True)
+    cpu_system_seconds = Column(Float, nullable=True)
+    peak_rss_kb = Column(Integer, nullable=True)
+    api_calls = Column(Integer, nullable=True) # Reported by the script via [RESULT]
 
     logs = relationship("Log", back_populates="run")
     leads = relationship("Lead", back_populates="run")
+    result = relationship("RunResult", back_populates="run", uselist=False)
+
+    # Newest-first listings / keyset pages (run_id breaks start_time ties),
+    # optionally filtered by status (RUNNING / FAILED dashboards)
+    __table_args__ = (
+        Index("ix_runs_start_time_run_id", start_time.desc(), run_id.desc()),
+        Index("ix_runs_status_start_time", "status", "start_time"),
+    )
 
 class Log(Base):
     __tablename__ = "logs"
@@ -27,9 +96,77 @@ class Log(Base):
     timestamp = Column(String)
     event_type = Column(String)
     data = Column(Text) # JSON string
+    # Set by instrumented scripts (POST /api/logs) so retried batches are no-ops
+    event_id = Column(String, nullable=True)
 
     run = relationship("Run", back_populates="logs")
 
+    # Keyset pagination over a run's logs: WHERE run_id = ? AND id > ? ORDER BY id
+    __table_args__ = (
+        Index("ix_logs_run_id_id", "run_id", "id"),
+        Index("ux_logs_event_id", "event_id", unique=True),
+    )
+
+class RunLogArchive(Base):
+    """
+    All logs of an old finished run packed into one compressed blob
+    (NDJSON of [id, timestamp, event_type, data]); see backend.log_archive.
+    """
+    __tablename__ = "run_log_archives"
+
+    run_id = Column(String, ForeignKey("runs.run_id"), primary_key=True)
+    codec = Column(String) # "zstd" or "gzip"
+    line_count = Column(Integer)
+    first_log_id = Column(Integer)
+    last_log_id = Column(Integer)
+    raw_bytes = Column(Integer)
+    blob = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RunResult(Base):
+    """
+    Typed outcome of a run, filled in as the script emits `[RESULT] {...}`
+    lines (see backend.run_results) so completion handling never has to
+    rescan the logs.
+    """
+    __tablename__ = "run_results"
+
+    run_id = Column(String, ForeignKey("runs.run_id"), primary_key=True)
+    sheet_url = Column(String, nullable=True)
+    lead_count = Column(Integer, nullable=True)
+    csv_path = Column(String, nullable=True)
+    credits_used = Column(Integer, nullable=True)
+    extra = Column(Text, nullable=True) # JSON Object string (any other result keys)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    run = relationship("Run", back_populates="result")
+
+class StepStat(Base):
+    """
+    Duration aggregate of one @step over one flush interval of one run
+    (count / sum / min / max / log-linear histogram, see backend.step_stats).
+    Merged per step by GET /api/steps/stats.
+    """
+    __tablename__ = "step_stats"
+
+    id = Column(Integer, primary_key=True)
+    flush_id = Column(String) # Client-generated; a retried flush is a no-op
+    run_id = Column(String, index=True)
+    script_name = Column(String)
+    step_name = Column(String)
+    flushed_at = Column(DateTime(timezone=True), default=utc_now)
+    count = Column(Integer)
+    errors = Column(Integer)
+    sum_ns = Column(BigInteger)
+    min_ns = Column(BigInteger)
+    max_ns = Column(BigInteger)
+    buckets = Column(JSON) # {bucket index: count}
+
+    __table_args__ = (
+        Index("ux_step_stats_flush_step", "flush_id", "step_name", unique=True),
+        Index("ix_step_stats_script_flushed_at", "script_name", "flushed_at"),
+    )
+
 class Lead(Base):
     __tablename__ = "leads"
     
@@ -48,6 +185,12 @@ class Lead(Base):
 
     run = relationship("Run", back_populates="leads")
 
+    # Per-run exports and case-insensitive email lookups / dedupe across runs
+    __table_args__ = (
+        Index("ix_leads_run_id", "run_id"),
+        Index("ix_leads_email_lower", func.lower(email)),
+    )
+
 class WorkspaceConfig(Base):
     __tablename__ = "workspace_configs"
     
@@ -56,4 +199,5 @@ class WorkspaceConfig(Base):
     blitz_api_key = Column(String, nullable=True)
     million_verifier_api_key = Column(String, nullable=True)
     smartlead_api_key = Column(String, nullable=True)
+    max_concurrent_runs = Column(Integer, nullable=True) # None = DEFAULT_MAX_CONCURRENT_RUNS
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import os
+import secrets
+import time
+from typing import Dict, Optional
+
+import httpx
+
+# How long a definitive answer (valid / invalid key) is reused for the same key
+CHECK_CACHE_TTL_SECONDS = int(os.getenv("PROVIDER_CHECK_CACHE_TTL", "300"))
+CHECK_TIMEOUT_SECONDS = 5
+
+# Keys are never held in the cache, only a salted hash (salt lives and dies with the process)
+_SALT = secrets.token_bytes(16)
+_cache: Dict[str, tuple] = {}  # hash -> (expires_at, result)
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for vendor checks (closed by close_client on shutdown)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=CHECK_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _cache_key(service: str, api_key: str) -> str:
+    return hashlib.sha256(_SALT + f"{service}:{api_key}".encode()).hexdigest()
+
+
+async def check_apollo(client: httpx.AsyncClient, api_key: str) -> Dict:
+    headers = {"Content-Type": "application/json", "X-Api-Key": api_key}
+    # Apollo health check usually returns 200 and { is_logged_in: true } if valid
+    resp = await client.post("https://api.apollo.io/v1/auth/health", headers=headers)
+    if resp.status_code == 200: return {"status": "ok"}
+    # Fallback test: search (same connection, no second handshake)
+    resp = await client.post("https://api.apollo.io/v1/mixed_people/search", headers=headers,
+                             json={"page": 1, "per_page": 1})
+    if resp.status_code == 200: return {"status": "ok"}
+    return {"status": "error", "message": f"Apollo API Error: {resp.status_code}"}
+
+
+async def check_blitz(client: httpx.AsyncClient, api_key: str) -> Dict:
+    # Blitz needs a query to verify; enrich a dummy LinkedIn profile
+    resp = await client.post("https://api.blitz-api.ai/api/enrichment/email", headers={
+        "Content-Type": "application/json",
+        "x-api-key": api_key
+    }, json={"linkedin_profile_url": "https://linkedin.com/in/williamhgates"})
+    if resp.status_code in (200, 429): return {"status": "ok"} # 429 means key works but rate limited
+    if resp.status_code in (401, 403): return {"status": "error", "message": "Invalid API Key"}
+    return {"status": "ok"} # Other errors might be credits, but key is likely fine if not 401
+
+
+async def check_million_verifier(client: httpx.AsyncClient, api_key: str) -> Dict:
+    resp = await client.get("https://api.millionverifier.com/api/v3/credits", params={"api_key": api_key})
+    if resp.status_code == 200: return {"status": "ok"}
+    return {"status": "error", "message": "Invalid API Key"}
+
+
+CHECKS = {
+    "apollo": check_apollo,
+    "blitz": check_blitz,
+    "million_verifier": check_million_verifier,
+}
+
+
+async def check_key(service: str, api_key: str) -> Dict:
+    """Validates one vendor key, answering repeat checks of the same key from cache."""
+    check = CHECKS.get(service)
+    if check is None:
+        return {"status": "error", "message": "Unknown Service"}
+
+    key = _cache_key(service, api_key)
+    entry = _cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return dict(entry[1], cached=True)
+
+    try:
+        result = await check(get_client(), api_key)
+    except Exception as e:
+        # Network trouble says nothing about the key: don't cache it
+        return {"status": "error", "message": str(e)}
+
+    now = time.monotonic()
+    if len(_cache) > 1000:
+        for stale in [k for k, (expires_at, _) in _cache.items() if expires_at <= now]:
+            _cache.pop(stale, None)
+    _cache[key] = (now + CHECK_CACHE_TTL_SECONDS, result)
+    return result
+
+
+async def check_keys(keys: Dict[str, str]) -> Dict[str, Dict]:
+    """Checks several services concurrently: {service: api_key} -> {service: result}."""
+    services = list(keys)
+    results = await asyncio.gather(*(check_key(s, keys[s]) for s in services))
+    return dict(zip(services, results))
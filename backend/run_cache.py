@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+import redis
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from backend.celery_app import REDIS_URL
+
+# Bumped (INCR) whenever a run is created or its status / row changes. Run
+# listing responses are keyed on it: same version -> same body.
+RUNS_VERSION_KEY = "runs:version"
+# Upper bound on reusing a rendered body within one version (covers writes that
+# skip the bump, e.g. a script updating runs directly)
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RUNS_RESPONSE_CACHE_TTL", "5"))
+RESPONSE_CACHE_MAX_ENTRIES = 256
+
+_client = None
+_async_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    return _client
+
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        import redis.asyncio as aioredis
+        _async_client = aioredis.Redis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    return _async_client
+
+
+def _seed_value() -> int:
+    # A missing counter (fresh or flushed Redis) restarts from the clock, not 0,
+    # so it never re-issues an ETag a client still holds from before.
+    return int(time.time() * 1000)
+
+
+def bump_runs_version():
+    """Call after committing a run insert / status change (sync callers: worker, sync endpoints)."""
+    try:
+        pipe = _get_client().pipeline()
+        pipe.set(RUNS_VERSION_KEY, _seed_value(), nx=True)
+        pipe.incr(RUNS_VERSION_KEY)
+        pipe.execute()
+    except Exception as e:
+        print(f"[RunCache] Failed to bump runs version: {e}")
+
+
+async def bump_runs_version_async():
+    try:
+        pipe = _get_async_client().pipeline()
+        pipe.set(RUNS_VERSION_KEY, _seed_value(), nx=True)
+        pipe.incr(RUNS_VERSION_KEY)
+        await pipe.execute()
+    except Exception as e:
+        print(f"[RunCache] Failed to bump runs version: {e}")
+
+
+async def get_runs_version() -> Optional[int]:
+    """Current version, or None if Redis is unavailable (callers then skip caching)."""
+    try:
+        client = _get_async_client()
+        value = await client.get(RUNS_VERSION_KEY)
+        if value is None:
+            await client.set(RUNS_VERSION_KEY, _seed_value(), nx=True)
+            value = await client.get(RUNS_VERSION_KEY)
+        return int(value)
+    except Exception:
+        return None
+
+
+class ResponseCache:
+    """Small LRU of rendered JSON bodies, each valid for one runs version and a short TTL."""
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL_SECONDS, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str, version: int) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entry_version, expires_at, body = entry
+        if entry_version != version or expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return body
+
+    def set(self, key: str, version: int, body: bytes):
+        self._entries[key] = (version, time.monotonic() + self.ttl, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def make_etag(version: int, key: str) -> str:
+    digest = hashlib.sha1(f"{version}:{key}".encode()).hexdigest()[:20]
+    return f'"runs-{version}-{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+async def cached_runs_response(request: Request, build: Callable[[], Awaitable[Dict]]) -> Response:
+    """
+    Conditional GET for run listings. With an unchanged runs version this
+    answers 304 (If-None-Match) or serves the rendered body from memory
+    without calling `build`, i.e. without touching the database.
+    """
+    version = await get_runs_version()
+    if version is None:
+        body = json.dumps(jsonable_encoder(await build())).encode()
+        return Response(content=body, media_type="application/json")
+
+    key = f"{request.url.path}?{request.url.query}"
+    etag = make_etag(version, key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(key, version)
+    if body is None:
+        body = json.dumps(jsonable_encoder(await build())).encode()
+        response_cache.set(key, version, body)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,74 @@
+import json
+from typing import Dict, Optional
+
+from backend.models import Run, RunResult
+
+# Scripts report structured results on stdout, one JSON object per line:
+#   [RESULT] {"sheet_url": "https://...", "lead_count": 250}
+# (backend.instrumentation.emit_result writes this format)
+RESULT_PREFIX = "[RESULT]"
+LEGACY_SHEET_MARKER = "Sheet URL:"
+
+RESULT_COLUMNS = ("sheet_url", "lead_count", "csv_path", "credits_used")
+# Reported through the same channel but stored on `runs` for /api/metrics/runs
+RUN_COLUMNS = ("api_calls",)
+
+
+def parse_result_line(line: str) -> Optional[Dict]:
+    """Returns the result fields carried by an output line, or None."""
+    stripped = line.strip()
+    if stripped.startswith(RESULT_PREFIX):
+        try:
+            fields = json.loads(stripped[len(RESULT_PREFIX):].strip())
+            return fields if isinstance(fields, dict) else None
+        except Exception:
+            return None
+
+    # Older scripts only print the sheet link
+    if LEGACY_SHEET_MARKER in stripped:
+        sheet_url = stripped.split(LEGACY_SHEET_MARKER, 1)[1].strip()
+        if sheet_url:
+            return {"sheet_url": sheet_url}
+    return None
+
+
+def record_result(db, run_id: str, fields: Dict):
+    """Merges `fields` into the run's result row (later values win)."""
+    result = db.query(RunResult).filter(RunResult.run_id == run_id).first()
+    if not result:
+        result = RunResult(run_id=run_id)
+        db.add(result)
+
+    extra = json.loads(result.extra) if result.extra else {}
+    for key, value in fields.items():
+        if key in RUN_COLUMNS:
+            try:
+                db.query(Run).filter(Run.run_id == run_id).update({key: int(value)})
+            except (TypeError, ValueError):
+                pass
+        elif key in RESULT_COLUMNS:
+            if key in ("lead_count", "credits_used") and value is not None:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    continue
+            setattr(result, key, value)
+        else:
+            extra[key] = value
+    result.extra = json.dumps(extra) if extra else None
+    db.commit()
+    if any(key in RUN_COLUMNS for key in fields):
+        # api_calls is shown in the run listings
+        from backend.run_cache import bump_runs_version
+        bump_runs_version()
+    return result
+
+
+def get_result(db, run_id: str) -> Optional[Dict]:
+    result = db.query(RunResult).filter(RunResult.run_id == run_id).first()
+    if not result:
+        return None
+    data = {key: getattr(result, key) for key in RESULT_COLUMNS}
+    if result.extra:
+        data.update(json.loads(result.extra))
+    return data
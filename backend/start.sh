@@ -14,9 +14,16 @@ fi
 # We do this in main.py startup event, but doing it explicitly here is fine too.
 # For now, relying on main.py startup.
 
-echo "Starting Celery Worker..."
-# Start Celery in background
-celery -A backend.celery_app worker --loglevel=info &
+echo "Starting Celery Workers..."
+# One worker per queue (see backend/celery_app.py) so long batch jobs
+# never hold the slots interactive and paid jobs need.
+celery -A backend.celery_app worker -Q interactive -n interactive@%h --concurrency=${INTERACTIVE_CONCURRENCY:-2} --loglevel=info &
+celery -A backend.celery_app worker -Q paid -n paid@%h --concurrency=${PAID_CONCURRENCY:-2} --loglevel=info &
+celery -A backend.celery_app worker -Q batch -n batch@%h --concurrency=${BATCH_CONCURRENCY:-2} --loglevel=info &
+
+echo "Starting Celery Beat..."
+# Periodic maintenance (log compaction); exactly one beat per deployment
+celery -A backend.celery_app beat --loglevel=info --schedule /tmp/celerybeat-schedule &
 
 echo "Starting Uvicorn Server..."
 # Start Uvicorn in foreground (so container keeps running)
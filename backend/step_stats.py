@@ -0,0 +1,117 @@
+from typing import Dict, Iterable, List, Optional
+
+# Log-linear histogram of step durations (ns), shared by the scripts that
+# record it (backend.instrumentation) and the API that merges it.
+# Values below SUB_BUCKETS get exact buckets; above that each power of two
+# is split into SUB_BUCKETS equal buckets, so any recorded value is within
+# 1/SUB_BUCKETS (6.25%) of its bucket's bounds. Buckets are sparse
+# {index: count} dicts, a few dozen entries for a typical step.
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def bucket_index(value_ns: int) -> int:
+    if value_ns < SUB_BUCKETS:
+        return max(value_ns, 0)
+    exponent = value_ns.bit_length() - 1
+    shift = exponent - SUB_BUCKET_BITS
+    return SUB_BUCKETS + shift * SUB_BUCKETS + ((value_ns >> shift) - SUB_BUCKETS)
+
+
+def bucket_bounds(index: int):
+    """[lower, upper) in ns of a bucket index."""
+    if index < SUB_BUCKETS:
+        return index, index + 1
+    shift, sub = divmod(index - SUB_BUCKETS, SUB_BUCKETS)
+    return (SUB_BUCKETS + sub) << shift, (SUB_BUCKETS + sub + 1) << shift
+
+
+class StepAggregate:
+    """count / errors / sum / min / max / histogram of one step's durations."""
+
+    __slots__ = ("count", "errors", "sum_ns", "min_ns", "max_ns", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.sum_ns = 0
+        self.min_ns = None
+        self.max_ns = None
+        self.buckets: Dict[int, int] = {}
+
+    def record(self, duration_ns: int, failed: bool = False):
+        self.count += 1
+        self.errors += failed
+        self.sum_ns += duration_ns
+        if self.min_ns is None or duration_ns < self.min_ns:
+            self.min_ns = duration_ns
+        if self.max_ns is None or duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        index = bucket_index(duration_ns)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other: Dict):
+        """Adds a serialized aggregate (to_dict output, JSON keys as strings)."""
+        self.count += other["count"]
+        self.errors += other.get("errors") or 0
+        self.sum_ns += other["sum_ns"]
+        for bound, pick in (("min_ns", min), ("max_ns", max)):
+            if other.get(bound) is not None:
+                current = getattr(self, bound)
+                setattr(self, bound, other[bound] if current is None else pick(current, other[bound]))
+        for index, count in other["buckets"].items():
+            index = int(index)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def percentile(self, pct: float) -> Optional[int]:
+        """Approximate pct-th percentile in ns (bucket midpoint, clamped to min/max)."""
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * pct // 100))  # ceil, nearest-rank
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                lower, upper = bucket_bounds(index)
+                return min(max((lower + upper - 1) // 2, self.min_ns), self.max_ns)
+        return self.max_ns
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "sum_ns": self.sum_ns,
+            "min_ns": self.min_ns,
+            "max_ns": self.max_ns,
+            "buckets": self.buckets,
+        }
+
+
+def summarize_steps(rows: Iterable[Dict]) -> List[Dict]:
+    """
+    Merges flushed aggregates ({step_name, count, ..., buckets}) per step and
+    returns ms summaries with p50/p95/p99, slowest total first.
+    """
+    merged: Dict[str, StepAggregate] = {}
+    for row in rows:
+        merged.setdefault(row["step_name"], StepAggregate()).merge(row)
+
+    def ms(ns):
+        return round(ns / 1e6, 4) if ns is not None else None
+
+    summary = []
+    for name, agg in merged.items():
+        summary.append({
+            "step": name,
+            "count": agg.count,
+            "errors": agg.errors,
+            "total_ms": ms(agg.sum_ns),
+            "mean_ms": ms(agg.sum_ns / agg.count) if agg.count else None,
+            "min_ms": ms(agg.min_ns),
+            "max_ms": ms(agg.max_ns),
+            "p50_ms": ms(agg.percentile(50)),
+            "p95_ms": ms(agg.percentile(95)),
+            "p99_ms": ms(agg.percentile(99)),
+        })
+    summary.sort(key=lambda s: s["total_ms"] or 0, reverse=True)
+    return summary
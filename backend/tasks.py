@@ -1,25 +1,109 @@
 import os
-import json
-import subprocess
 import sys
-from datetime import datetime
-from typing import List, Dict
+import time
+from typing import List, Dict, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 from backend.celery_app import celery_app
 from backend.database import SessionLocal
-from backend.models import Run, Log
+from backend.models import Run, RunResult, WorkspaceConfig, utc_now
+from backend.log_writer import BufferedLogWriter
+from backend.log_stream import RunLogPublisher
+from backend.run_results import parse_result_line, record_result
+from backend.run_cache import bump_runs_version
+from backend.heartbeat import RunHeartbeat, reap_stalled_runs, IDEMPOTENT_SCRIPTS
+from backend.log_archive import FINISHED_STATUSES
+from backend.tracing import span, SPAN_KIND_CONSUMER
+from backend.executor import start_script, wait_with_rusage, warm_up, EXECUTOR_MODE
+from backend.concurrency import (
+    acquire_slot, release_slot, workspace_for_args, DEFAULT_MAX_CONCURRENT_RUNS, RETRY_SECONDS
+)
+from celery.signals import worker_process_init
+from celery.exceptions import Retry
 from backend.email_service import send_job_completion_email, send_job_failure_email
 
+# Scripts that email their own completion notice (with lead counts); the worker
+# doesn't send a second one for them
+SELF_NOTIFYING_SCRIPTS = {"lead_gen_orchestrator.py"}
+
+@worker_process_init.connect
+def warm_script_executor(**kwargs):
+    # One warm interpreter per pool process (no-op unless SCRIPT_EXECUTOR=forkserver)
+    warm_up()
+
+def workspace_run_limit(db, workspace_id: str) -> int:
+    config = db.query(WorkspaceConfig.max_concurrent_runs).filter(WorkspaceConfig.workspace_id == workspace_id).first()
+    if config and config.max_concurrent_runs:
+        return config.max_concurrent_runs
+    return DEFAULT_MAX_CONCURRENT_RUNS
+
+def stored_traceparent(run_id: str) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        row = db.query(Run.traceparent).filter(Run.run_id == run_id).first()
+        return row.traceparent if row else None
+    finally:
+        db.close()
+
 @celery_app.task(bind=True)
-def run_script_task(self, script_name: str, args: List[str], env_vars: Dict[str, str], run_id: str):
+def run_script_task(self, script_name: str, args: List[str], env_vars: Dict[str, str], run_id: str,
+                    workspace_id: Optional[str] = None):
     """
     Executes a script in the background using Celery.
     Logs output to Postgres via SQLAlchemy.
     """
+    # Continue the trace of the request that queued the run: the Celery header
+    # (celery_app.inject_trace_context), else the context stored on the run
+    # (re-enqueued by the reaper, queued before tracing existed)
+    parent = self.request.get("traceparent") or stored_traceparent(run_id)
+    retry = None
+    with span("celery.run_script_task", parent=parent, kind=SPAN_KIND_CONSUMER,
+              **{"run.id": run_id, "script.name": script_name}) as task_span:
+        try:
+            return _run_script(self, script_name, args, env_vars, run_id, workspace_id)
+        except Retry as e:
+            # Waiting for a workspace slot is not a failure
+            task_span.set("celery.retry", True)
+            retry = e
+    raise retry
+
+def _run_script(self, script_name: str, args: List[str], env_vars: Dict[str, str], run_id: str,
+                workspace_id: Optional[str]):
     db = SessionLocal()
-    
+
+    # acks_late redelivers a task whose worker died; if the reaper already
+    # settled the run (STALLED) or it finished, don't start it again. A run
+    # still RUNNING was started by an earlier delivery: only idempotent
+    # scripts may start over, anything else is left to the reaper.
+    existing = db.query(Run.status).filter(Run.run_id == run_id).first()
+    if existing and (existing.status in FINISHED_STATUSES or (
+            existing.status == "RUNNING" and os.path.basename(script_name) not in IDEMPOTENT_SCRIPTS)):
+        db.close()
+        print(f"[Celery] Run {run_id} already {existing.status}, skipping")
+        return f"Skipped ({existing.status})"
+
+    # Per-workspace concurrency cap: if the workspace is at its limit, go back
+    # on the queue instead of holding this worker (position is kept in Redis).
+    workspace_id = workspace_id or workspace_for_args(args)
+    if workspace_id:
+        position = acquire_slot(workspace_id, run_id, workspace_run_limit(db, workspace_id))
+        if position:
+            db.close()
+            print(f"[Celery] Run {run_id} waiting for a slot in {workspace_id} (position {position})")
+            queue = (self.request.delivery_info or {}).get("routing_key")
+            raise self.retry(countdown=RETRY_SECONDS, max_retries=None, queue=queue)
+
+    # From here on a slot may be held: whatever happens (even before the
+    # script starts), close the session and give the slot back
+    try:
+        return _execute_script(db, script_name, args, env_vars, run_id)
+    finally:
+        db.close()
+        if workspace_id:
+            release_slot(workspace_id, run_id)
+
+def _execute_script(db, script_name: str, args: List[str], env_vars: Dict[str, str], run_id: str):
     # Path resolution logic
     # Ensure env vars are loaded in worker
     from dotenv import load_dotenv
@@ -48,9 +132,9 @@ def run_script_task(self, script_name: str, args: List[str], env_vars: Dict[str,
             run = db.query(Run).filter(Run.run_id == run_id).first()
             if run:
                 run.status = "FAILED"
-                run.end_time = datetime.utcnow().isoformat()
+                run.end_time = utc_now()
                 db.commit()
-            db.close()
+                bump_runs_version()
             return "Script Not Found"
 
     # Merge Env Vars
@@ -62,59 +146,74 @@ def run_script_task(self, script_name: str, args: List[str], env_vars: Dict[str,
         current_env["API_BASE_URL"] = "http://localhost:8000/api"
 
     cmd = ["python3", "-u", script_path] + args
-    print(f"[Celery] Starting: {' '.join(cmd)}")
+    print(f"[Celery] Starting ({EXECUTOR_MODE}): {' '.join(cmd)}")
 
     # Update Status to RUNNING
     run = db.query(Run).filter(Run.run_id == run_id).first()
     if run:
         run.status = "RUNNING"
+        run.heartbeat_at = utc_now()
         db.commit()
+        bump_runs_version()
+
+    # Live tail for SSE subscribers (GET /api/runs/{run_id}/stream)
+    log_stream = RunLogPublisher(run_id)
+    final_status = "ERROR"
+    heartbeat = RunHeartbeat(run_id)
 
     try:
-        process = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.STDOUT, 
-            text=True, 
-            env=current_env,
-            bufsize=1
-        )
-
-        # Stream logs
-        for line in iter(process.stdout.readline, ''):
-            if not line: break
-            
-            # Print to worker logs
-            sys.stdout.write(line)
-            sys.stdout.flush()
-            
-            # Log to DB
-            try:
-                log_data = {"stdout": line.strip()}
-                new_log = Log(
-                    run_id=run_id,
-                    timestamp=datetime.utcnow().isoformat(),
-                    event_type="SCRIPT_OUTPUT",
-                    data=json.dumps(log_data)
-                )
-                db.add(new_log)
-                db.commit()
-            except Exception as e:
-                print(f"Log DB Error: {e}")
+        heartbeat.start()
+        with span("script.run", **{"script.path": script_path, "executor": EXECUTOR_MODE}) as script_span:
+            # The script's own spans (provider calls, ...) nest under this one
+            if script_span.traceparent:
+                current_env["TRACEPARENT"] = script_span.traceparent
+            spawn_time = time.monotonic()
+            with span("subprocess.spawn"):
+                process = start_script(script_path, args, current_env)
+
+            # Stream logs (buffered: bulk-inserted by a background writer,
+            # status updates below keep using `db` directly)
+            with BufferedLogWriter(run_id) as log_writer:
+                for line in iter(process.stdout.readline, ''):
+                    if not line: break
+
+                    # Print to worker logs
+                    sys.stdout.write(line)
+                    sys.stdout.flush()
 
-        process.wait()
-        returncode = process.returncode
+                    log_writer.write(line)
+                    log_stream.publish(line)
+
+                    # Typed results ([RESULT] {...}) go straight to run_results
+                    result_fields = parse_result_line(line)
+                    if result_fields:
+                        try:
+                            record_result(db, run_id, result_fields)
+                        except Exception as e:
+                            db.rollback()
+                            print(f"Result DB Error: {e}")
+
+            returncode, usage = wait_with_rusage(process)
+            wall_seconds = time.monotonic() - spawn_time
+            script_span.set("process.exit_code", returncode)
         
         # Final Update
+        final_status = "COMPLETED" if returncode == 0 else "FAILED"
         run = db.query(Run).filter(Run.run_id == run_id).first()
         if run:
-            run.status = "COMPLETED" if returncode == 0 else "FAILED"
-            run.end_time = datetime.utcnow().isoformat()
+            run.status = final_status
+            run.end_time = utc_now()
+            run.wall_seconds = wall_seconds
+            run.cpu_user_seconds = usage.get("cpu_user_seconds")
+            run.cpu_system_seconds = usage.get("cpu_system_seconds")
+            run.peak_rss_kb = usage.get("peak_rss_kb")
             db.commit()
+            bump_runs_version()
 
         # Email Notification Logic
         if returncode == 0:
-            handle_email_notification(db, run_id, args)
+            if safe_script_name not in SELF_NOTIFYING_SCRIPTS:
+                handle_email_notification(db, run_id, args)
         else:
             handle_failure_email(db, run_id, args)
 
@@ -123,10 +222,12 @@ def run_script_task(self, script_name: str, args: List[str], env_vars: Dict[str,
         run = db.query(Run).filter(Run.run_id == run_id).first()
         if run:
             run.status = "ERROR"
-            run.end_time = datetime.utcnow().isoformat()
+            run.end_time = utc_now()
             db.commit()
+            bump_runs_version()
     finally:
-        db.close()
+        heartbeat.stop()
+        log_stream.close(final_status)
 
 def handle_email_notification(db, run_id, args):
     # Extract Email
@@ -140,22 +241,16 @@ def handle_email_notification(db, run_id, args):
     if not recipient_email:
         return
 
-    # Find Sheet URL in logs
-    logs = db.query(Log).filter(Log.run_id == run_id, Log.event_type == "SCRIPT_OUTPUT").all()
-    sheet_url = None
-    for log in logs:
-        try:
-            content = json.loads(log.data)
-            stdout = content.get('stdout', '')
-            if "Sheet URL:" in stdout:
-                parts = stdout.split("Sheet URL:")
-                if len(parts) > 1:
-                    sheet_url = parts[1].strip()
-        except: pass
-    
+    # Result is recorded as the script reports it, no log scan needed
+    result = db.query(RunResult).filter(RunResult.run_id == run_id).first()
+    sheet_url = result.sheet_url if result else None
+
     if sheet_url:
         print(f"[Celery] Sending email to {recipient_email}")
-        send_job_completion_email(recipient_email, sheet_url)
+        if result.lead_count is not None:
+            send_job_completion_email(recipient_email, sheet_url, f"{result.lead_count} leads have been enriched.")
+        else:
+            send_job_completion_email(recipient_email, sheet_url)
 
 def handle_failure_email(db, run_id, args):
     recipient_email = None
@@ -168,3 +263,26 @@ def handle_failure_email(db, run_id, args):
     if recipient_email:
         print(f"[Celery] Sending failure email to {recipient_email}")
         send_job_failure_email(recipient_email, "Script failed to execute correctly.")
+
+@celery_app.task
+def compact_run_logs_task():
+    """Periodic (beat): pack logs of old finished runs into run_log_archives."""
+    from backend.log_archive import compact_old_logs
+    from backend.tracing import prune_traces
+    db = SessionLocal()
+    try:
+        result = compact_old_logs(db)
+    finally:
+        db.close()
+    # Local trace files (backend.tracing) older than TRACE_RETENTION_DAYS
+    prune_traces()
+    return result
+
+@celery_app.task
+def reap_stalled_runs_task():
+    """Periodic (beat): mark RUNNING runs whose worker stopped heartbeating as STALLED."""
+    db = SessionLocal()
+    try:
+        return reap_stalled_runs(db)
+    finally:
+        db.close()
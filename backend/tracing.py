@@ -0,0 +1,399 @@
+import atexit
+import contextvars
+import json
+import os
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Minimal tracing for one lead job across API -> Celery -> script subprocess.
+# Context travels as a W3C traceparent ("00-<trace_id>-<span_id>-01"): the
+# `traceparent` HTTP / Celery header, runs.traceparent, and the TRACEPARENT
+# env var of the script. Finished spans are written as OTLP/JSON
+# (ExportTraceServiceRequest, one JSON document per line) to
+# TRACE_EXPORT_DIR/<trace_id>.jsonl, so every process touching a trace
+# appends to the same file and any OTLP JSON consumer can read it.
+# Every process that exports spans (API, worker, scripts) also prunes files
+# older than TRACE_RETENTION_DAYS, so an unshared TRACE_EXPORT_DIR stays bounded.
+# Importable by scripts: no backend / SQLAlchemy imports at module level.
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+TRACE_EXPORT_DIR = os.getenv("TRACE_EXPORT_DIR") or os.path.join(tempfile.gettempdir(), "sipes-traces")
+TRACE_RETENTION_DAYS = float(os.getenv("TRACE_RETENTION_DAYS", "7"))
+# Buffered spans are written when a local root span ends, at exit, or at this size
+EXPORT_BATCH_SIZE = 256
+# How often a process that exports spans also deletes expired trace files
+PRUNE_INTERVAL_SECONDS = 3600
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+SPAN_KIND_CONSUMER = 5
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+SpanContext = Tuple[str, str]  # (trace_id, span_id)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def format_traceparent(ctx: SpanContext) -> str:
+    return f"00-{ctx[0]}-{ctx[1]}-01"
+
+
+def _process_parent() -> Optional[SpanContext]:
+    # Read on every use: the fork server imports this before the job's env is set
+    return parse_traceparent(os.environ.get("TRACEPARENT"))
+
+
+def current_context() -> Optional[SpanContext]:
+    """Active span in this task / thread, else the one the process was started under."""
+    return _current.get() or _process_parent()
+
+
+def current_traceparent() -> Optional[str]:
+    ctx = current_context()
+    return format_traceparent(ctx) if ctx else None
+
+
+def _attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind", "attributes",
+                 "start_ns", "end_ns", "status", "message", "local_root")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int,
+                 attributes: Dict, local_root: bool):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = STATUS_OK
+        self.message = None
+        self.local_root = local_root
+
+    @property
+    def traceparent(self) -> str:
+        return format_traceparent((self.trace_id, self.span_id))
+
+    def set(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def error(self, message: str):
+        self.status = STATUS_ERROR
+        self.message = message
+
+    def to_otlp(self) -> Dict:
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        if self.message:
+            otlp["status"]["message"] = self.message
+        return otlp
+
+
+class _NoopSpan:
+    traceparent = None
+
+    def set(self, key, value):
+        pass
+
+    def error(self, message):
+        pass
+
+
+class FileSpanExporter:
+    """
+    Buffers finished spans and appends them per trace to <dir>/<trace_id>.jsonl.
+    Writes happen on a background thread (never on the caller, e.g. the API's
+    event loop), which also prunes expired trace files every
+    PRUNE_INTERVAL_SECONDS. flush() writes synchronously (exit, os._exit paths).
+    """
+
+    def __init__(self, directory: str = TRACE_EXPORT_DIR):
+        self.directory = directory
+        self._buffer: List[Span] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._registered = False
+
+    def export(self, span: Span):
+        with self._lock:
+            self._buffer.append(span)
+            if not self._registered:
+                atexit.register(self.flush)
+                self._registered = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                self._thread.start()
+            full = len(self._buffer) >= EXPORT_BATCH_SIZE
+        if full or span.local_root:
+            self._wake.set()
+
+    def _run(self):
+        next_prune = time.monotonic()
+        while True:
+            if time.monotonic() >= next_prune:
+                prune_traces(self.directory)
+                next_prune = time.monotonic() + PRUNE_INTERVAL_SECONDS
+            if self._wake.wait(PRUNE_INTERVAL_SECONDS):
+                self._wake.clear()
+                self.flush()
+
+    def _after_fork(self):
+        # The writer thread doesn't survive fork (Celery prefork, fork server)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def flush(self):
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+        if not spans:
+            return
+        by_trace: Dict[str, List[Dict]] = {}
+        for span in spans:
+            by_trace.setdefault(span.trace_id, []).append(span.to_otlp())
+        resource = {"attributes": [
+            _attribute("service.name", os.getenv("TRACE_SERVICE_NAME") or os.path.basename(sys.argv[0]) or "python"),
+            _attribute("process.pid", os.getpid()),
+        ]}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for trace_id, otlp_spans in by_trace.items():
+                line = json.dumps({"resourceSpans": [{
+                    "resource": resource,
+                    "scopeSpans": [{"scope": {"name": "sipes.tracing"}, "spans": otlp_spans}],
+                }]})
+                # One write per line in append mode: concurrent processes don't interleave
+                with open(os.path.join(self.directory, f"{trace_id}.jsonl"), "a") as f:
+                    f.write(line + "\n")
+        except Exception as e:
+            print(f"[Tracing] Export failed: {e}")
+
+
+exporter = FileSpanExporter()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=exporter._after_fork)
+
+
+def flush():
+    exporter.flush()
+
+
+@contextmanager
+def span(name: str, parent=None, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """
+    Records `name` around the block. Parent: an explicit traceparent string
+    (remote caller, stored run) or the current span; with neither, a new
+    trace starts. Exceptions mark the span as failed and propagate.
+    """
+    if not TRACING_ENABLED:
+        yield _NoopSpan()
+        return
+
+    remote = parse_traceparent(parent) if isinstance(parent, str) else None
+    parent_ctx = remote or current_context()
+    trace_id = parent_ctx[0] if parent_ctx else secrets.token_hex(16)
+    # A span that starts this process's part of the trace flushes the buffer when it
+    # ends; a script's spans (parent from TRACEPARENT) are batched until exit
+    s = Span(name, trace_id, parent_ctx[1] if parent_ctx else None, kind,
+             {k: v for k, v in attributes.items() if v is not None},
+             local_root=remote is not None or parent_ctx is None)
+    token = _current.set((trace_id, s.span_id))
+    start = time.perf_counter_ns()
+    try:
+        yield s
+    except BaseException as e:
+        s.error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        s.end_ns = s.start_ns + (time.perf_counter_ns() - start)
+        exporter.export(s)
+
+
+def record_span(name: str, start_ns: int, duration_ns: int, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """Records an already finished span under the current context (skipped outside a trace)."""
+    parent_ctx = current_context()
+    if not TRACING_ENABLED or parent_ctx is None:
+        return
+    s = Span(name, parent_ctx[0], parent_ctx[1], kind,
+             {k: v for k, v in attributes.items() if v is not None}, local_root=False)
+    s.start_ns = start_ns
+    s.end_ns = start_ns + duration_ns
+    exporter.export(s)
+
+
+def wrap(fn):
+    """Runs fn in the caller's trace context (for ThreadPoolExecutor.submit / map)."""
+    ctx = contextvars.copy_context()
+    # A Context can only be entered by one thread at a time: copy per call
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+def trace_session_commits(session_cls):
+    """Records a db.commit span (flush + COMMIT) for every commit made inside a trace."""
+    from sqlalchemy import event
+
+    key = "_trace_commit_start"
+
+    @event.listens_for(session_cls, "before_commit")
+    def _before_commit(session):
+        if current_context() is not None:
+            session.info[key] = (time.time_ns(), time.perf_counter_ns())
+
+    @event.listens_for(session_cls, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop(key, None)
+        if started:
+            bind = session.bind
+            record_span("db.commit", started[0], time.perf_counter_ns() - started[1], kind=SPAN_KIND_CLIENT,
+                        **{"db.system": bind.dialect.name if bind is not None else None})
+
+    @event.listens_for(session_cls, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop(key, None)
+
+
+# --- Reading traces back ---
+
+def _attribute_value(value: Dict):
+    for typed in ("stringValue", "boolValue", "doubleValue"):
+        if typed in value:
+            return value[typed]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def load_trace(trace_id: str, directory: str = TRACE_EXPORT_DIR) -> List[Dict]:
+    """All exported spans of a trace, flattened: name, ids, service, start/end ns, attributes."""
+    path = os.path.join(directory, f"{trace_id}.jsonl")
+    if not trace_id.isalnum() or not os.path.exists(path):
+        return []
+    spans = []
+    with open(path) as f:
+        for line in f:
+            try:
+                doc = json.loads(line)
+            except ValueError:
+                continue  # partially written tail
+            for resource_spans in doc.get("resourceSpans", []):
+                resource = {a["key"]: _attribute_value(a["value"])
+                            for a in resource_spans.get("resource", {}).get("attributes", [])}
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for s in scope_spans.get("spans", []):
+                        spans.append({
+                            "name": s["name"],
+                            "span_id": s["spanId"],
+                            "parent_id": s.get("parentSpanId"),
+                            "service": resource.get("service.name"),
+                            "start_ns": int(s["startTimeUnixNano"]),
+                            "end_ns": int(s["endTimeUnixNano"]),
+                            "status": "error" if s.get("status", {}).get("code") == STATUS_ERROR else "ok",
+                            "attributes": {a["key"]: _attribute_value(a["value"]) for a in s.get("attributes", [])},
+                        })
+    return spans
+
+
+def build_timeline(spans: List[Dict]) -> List[Dict]:
+    """
+    Flame-style order: depth-first from the roots, children by start time,
+    each span with depth, offset_ms from the trace start and duration_ms.
+    Spans whose parent was never exported are treated as roots.
+    """
+    if not spans:
+        return []
+    ids = {s["span_id"] for s in spans}
+    children: Dict[Optional[str], List[Dict]] = {}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children.setdefault(parent, []).append(s)
+    for group in children.values():
+        group.sort(key=lambda s: s["start_ns"])
+    trace_start = min(s["start_ns"] for s in spans)
+
+    timeline = []
+    stack = [(s, 0) for s in reversed(children.get(None, []))]
+    while stack:
+        s, depth = stack.pop()
+        timeline.append(dict(
+            s, depth=depth,
+            offset_ms=round((s["start_ns"] - trace_start) / 1e6, 3),
+            duration_ms=round((s["end_ns"] - s["start_ns"]) / 1e6, 3),
+        ))
+        stack.extend((c, depth + 1) for c in reversed(children.get(s["span_id"], [])))
+    return timeline
+
+
+def render_timeline(timeline: List[Dict], width: int = 60) -> str:
+    """Text flame chart: one line per span, indented by depth, bar placed on the trace's time axis."""
+    if not timeline:
+        return ""
+    total = max(t["offset_ms"] + t["duration_ms"] for t in timeline) or 1
+    label_width = min(max(2 * t["depth"] + len(t["name"]) for t in timeline), 48)
+    lines = []
+    for t in timeline:
+        label = ("  " * t["depth"] + t["name"])[:label_width].ljust(label_width)
+        start = int(t["offset_ms"] / total * width)
+        length = max(1, int(t["duration_ms"] / total * width))
+        bar = (" " * start + "#" * length)[:width].ljust(width)
+        marker = " !" if t["status"] == "error" else ""
+        lines.append(f"{label} |{bar}| {t['duration_ms']:>10.1f} ms  {t['service'] or ''}{marker}")
+    return "\n".join(lines)
+
+
+def prune_traces(directory: str = TRACE_EXPORT_DIR, retention_days: float = TRACE_RETENTION_DAYS) -> int:
+    """Deletes trace files not written to for `retention_days`."""
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - retention_days * 86400
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
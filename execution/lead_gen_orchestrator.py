@@ -3,13 +3,13 @@ import os
 import argparse
 import sys
 import json
-import csv
 import time
+import threading
+import queue
 import requests
 from datetime import datetime
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Table, MetaData, insert
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import redis
 import hashlib
 import smtplib
@@ -44,6 +44,37 @@ except ImportError:
     except ImportError:
         pass
 
+# Chunked lead persistence (COPY on Postgres)
+try:
+    from .lead_store import LeadWriter
+except ImportError:
+    try:
+        from lead_store import LeadWriter
+    except ImportError:
+        from execution.lead_store import LeadWriter
+
+# Structured results for the task runner (no-op print fallback if backend isn't importable)
+try:
+    from backend.instrumentation import emit_result
+except ImportError:
+    def emit_result(**fields):
+        print(f"[RESULT] {json.dumps(fields, default=str)}")
+        sys.stdout.flush()
+
+# Spans for provider calls, joined to the run's trace via TRACEPARENT (no-op fallback)
+try:
+    from backend.tracing import span, wrap, SPAN_KIND_CLIENT
+except ImportError:
+    from contextlib import contextmanager
+    SPAN_KIND_CLIENT = 3
+    class _NoSpan:
+        def set(self, key, value): pass
+    @contextmanager
+    def span(name, parent=None, kind=None, **attributes):
+        yield _NoSpan()
+    def wrap(fn):
+        return fn
+
 load_dotenv()
 
 APOLLO_API_URL = "https://api.apollo.io/v1/mixed_people/search"
@@ -51,7 +82,25 @@ BLITZ_API_URL = "https://api.blitz-api.ai/api/enrichment/email"
 APOLLO_API_KEY = os.getenv("APOLLO_API_KEY")
 BLITZ_API_KEY = os.getenv("BLITZ_API_KEY")
 
-def fetch_and_enrich_leads(apollo_url, limit=100, skip_enrichment=False, mock_mode=False):
+# Outbound provider requests made by this run (reported as api_calls)
+API_CALLS = {"apollo": 0, "blitz": 0}
+_api_calls_lock = threading.Lock()
+
+# fetch_and_enrich_leads: Apollo page fetchers, Blitz enrichment workers, and
+# how many fetched people may wait for enrichment
+FETCH_WORKERS = 5
+ENRICH_WORKERS = 5
+PIPELINE_QUEUE_SIZE = int(os.getenv("LEAD_PIPELINE_QUEUE_SIZE", "500"))
+_END_OF_PEOPLE = object()
+
+def count_api_call(provider):
+    with _api_calls_lock:
+        API_CALLS[provider] += 1
+
+def fetch_and_enrich_leads(apollo_url, limit=100, skip_enrichment=False, mock_mode=False, on_verified=None):
+    # on_verified(lead) is called for each verified lead as soon as it is found
+    # (used to stream leads into the DB while enrichment is still running).
+    # It runs on the enrichment worker threads, so it must be thread-safe.
     if mock_mode:
         print(f"[MOCK] Starting Fake Fetch for URL: {apollo_url}")
         print(f"[MOCK] Generating {limit} dummy leads...")
@@ -72,6 +121,8 @@ def fetch_and_enrich_leads(apollo_url, limit=100, skip_enrichment=False, mock_mo
                 "location": "New York, USA",
                 "keywords": "testing, qa, automation"
             })
+            if on_verified:
+                on_verified(dummy_leads[-1])
             
         print("[MOCK] Fetch complete.")
         return dummy_leads
@@ -156,7 +207,12 @@ def fetch_and_enrich_leads(apollo_url, limit=100, skip_enrichment=False, mock_mo
         try:
             # Retry Check
             for attempt in range(3):
-                resp = requests.post(APOLLO_API_URL, headers=headers, json=local_payload, timeout=15)
+                count_api_call("apollo")
+                with span("apollo.search", kind=SPAN_KIND_CLIENT, **{
+                    "http.method": "POST", "http.url": APOLLO_API_URL, "apollo.page": page_num, "retry.attempt": attempt
+                }) as http_span:
+                    resp = requests.post(APOLLO_API_URL, headers=headers, json=local_payload, timeout=15)
+                    http_span.set("http.status_code", resp.status_code)
                 if resp.status_code == 200:
                     data = resp.json()
                     # Cache Set
@@ -174,27 +230,15 @@ def fetch_and_enrich_leads(apollo_url, limit=100, skip_enrichment=False, mock_mo
             return []
         return []
 
-    # --- Step 2: Parallel Fetch ---
-    raw_leads = []
-    seen_ids = set()
-    
-    # User Concern: Apollo Rate Limits.
-    # Reduced workers from 10 -> 5 to be safe. Still 5x faster than sequential.
-    with ThreadPoolExecutor(max_workers=5) as executor: 
-        future_to_page = {executor.submit(fetch_page, p): p for p in range(1, total_pages_needed + 1)}
-        for future in as_completed(future_to_page):
-            people = future.result()
-            if people:
-                for p in people:
-                    pid = p.get('id')
-                    if pid not in seen_ids:
-                        seen_ids.add(pid)
-                        raw_leads.append(p)
-    
-    print(f"Fetched {len(raw_leads)} unique raw leads. Starting Parallel Enrichment...")
-
-    # --- Step 3: Parallel Enrichment ---
+    # --- Step 2+3: Pipelined Fetch -> Enrichment ---
+    # Pages are fetched in parallel and their people go into a bounded queue
+    # as each page arrives, so enrichment starts with the first page instead
+    # of after the last one. The bound keeps fetching from running far ahead
+    # of enrichment; reaching `limit` stops both sides.
+    people_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    limit_reached = threading.Event()
     verified_leads = []
+    verified_lock = threading.Lock()
     
     def enrich_lead(lead_data):
         l_new = lead_data.copy()
@@ -207,7 +251,12 @@ def fetch_and_enrich_leads(apollo_url, limit=100, skip_enrichment=False, mock_mo
             # Backoff for Blitz
             for attempt in range(3):
                 try:
-                    b_resp = requests.post(BLITZ_API_URL, headers=blitz_headers, json={"linkedin_profile_url": l_linkedin}, timeout=10)
+                    count_api_call("blitz")
+                    with span("blitz.enrich", kind=SPAN_KIND_CLIENT, **{
+                        "http.method": "POST", "http.url": BLITZ_API_URL, "retry.attempt": attempt
+                    }) as http_span:
+                        b_resp = requests.post(BLITZ_API_URL, headers=blitz_headers, json={"linkedin_profile_url": l_linkedin}, timeout=10)
+                        http_span.set("http.status_code", b_resp.status_code)
                     if b_resp.status_code == 200:
                         b_data = b_resp.json()
                         l_email = b_data.get('work_email') or b_data.get('email')
@@ -228,51 +277,106 @@ def fetch_and_enrich_leads(apollo_url, limit=100, skip_enrichment=False, mock_mo
             return l_new
         return None
 
+    def put_until_limit(item):
+        # Blocks while the queue is full, but gives up once the limit is reached
+        while not limit_reached.is_set():
+            try:
+                people_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        seen_ids = set()
+        unique = 0
+        # User Concern: Apollo Rate Limits.
+        # Reduced workers from 10 -> 5 to be safe. Still 5x faster than sequential.
+        executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+        try:
+            # wrap: pool threads don't inherit the caller's trace context
+            pending = {executor.submit(wrap(fetch_page), p) for p in range(1, total_pages_needed + 1)}
+            while pending:
+                # Short waits instead of as_completed, so reaching the limit isn't
+                # stuck behind a slow page (3 x 15s timeouts plus 429 backoff)
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                if limit_reached.is_set():
+                    return
+                for future in done:
+                    for p in future.result() or []:
+                        pid = p.get('id')
+                        if pid in seen_ids:
+                            continue
+                        seen_ids.add(pid)
+                        unique += 1
+                        if not put_until_limit(p):
+                            return
+        finally:
+            # Limit reached: pages not started yet are never requested, and
+            # in-flight ones finish in the background without being waited for
+            executor.shutdown(wait=False, cancel_futures=True)
+            print(f"Fetched {unique} unique raw leads.")
+            sys.stdout.flush()
+            for _ in range(ENRICH_WORKERS):
+                put_until_limit(_END_OF_PEOPLE)
+
+    def accept(lead):
+        with verified_lock:
+            if len(verified_leads) >= limit:
+                return
+            verified_leads.append(lead)
+            count = len(verified_leads)
+
+            # Report Progress
+            # More frequent updates for small batches
+            if limit < 50 or count % 5 == 0 or count >= limit:
+                print(f"[PROGRESS]: {count}/{limit}")
+                sys.stdout.flush()
+
+            if count >= limit:
+                print("Hit target limit! Stopping fetch and enrichment...")
+                limit_reached.set()
+
+        # Outside the lock: a chunked DB write here must not stall the other workers
+        if on_verified:
+            on_verified(lead)
+
+    def consume():
+        while not limit_reached.is_set():
+            try:
+                lead = people_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if lead is _END_OF_PEOPLE:
+                return
+            result = enrich_lead(lead)
+            if result:
+                accept(result)
+
     # High Concurrency for Enrichment
     # User Request: Throttling to avoid 429s. Blitz Limit ~5 req/sec.
     # We use 5 workers. Assuming each req takes >200ms, this is safe. 
     # If reqs are faster, we might hit limits, but our backoff handles it.
-    
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = []
-        # Submit all raw leads? Or chunks? submitting all is fine for <5000
-        # Initial Progress Log
-        print(f"[PROGRESS]: 0/{limit}")
-        sys.stdout.flush()
+    print(f"[PROGRESS]: 0/{limit}")
+    sys.stdout.flush()
 
-        for lead in raw_leads:
-            if len(verified_leads) >= limit: break # Pre-check, though futures launch fast
-            futures.append(executor.submit(enrich_lead, lead))
-            
-        completed_count = 0
-        for future in as_completed(futures):
-            result = future.result()
-            completed_count += 1
-            
-            if result:
-                verified_leads.append(result)
-                
-                # Report Progress
-                # More frequent updates for small batches
-                if limit < 50 or len(verified_leads) % 5 == 0 or len(verified_leads) >= limit:
-                    print(f"[PROGRESS]: {len(verified_leads)}/{limit}")
-                    sys.stdout.flush()
-            
-            # Interactive Break found?
-            if len(verified_leads) >= limit:
-                print("Hit target limit! Finishing pending tasks...")
-                # We stop processing new results we care about, effectively stopping.
-                break
+    producer = threading.Thread(target=wrap(produce), name="apollo-fetch", daemon=True)
+    with ThreadPoolExecutor(max_workers=ENRICH_WORKERS) as executor:
+        consumers = [executor.submit(wrap(consume)) for _ in range(ENRICH_WORKERS)]
+        producer.start()
+        try:
+            for consumer in consumers:
+                consumer.result()
+        finally:
+            # All consumers done (or one failed): release a producer blocked on a full queue
+            limit_reached.set()
+    producer.join()
 
     print(f"Final Count: Found {len(verified_leads)} verified leads.")
     return verified_leads[:limit]
 
-def get_preview_leads(apollo_url):
-    """
-    Fetches 10 leads, enriches them, and masks emails for preview.
-    """
-    leads = fetch_and_enrich_leads(apollo_url, limit=10, skip_enrichment=True)
-    
+def build_preview_rows(leads):
+    """Masks emails and keeps only the preview columns."""
     # Mask emails
     for lead in leads:
         email = lead.get('blitz_email', '')
@@ -288,7 +392,6 @@ def get_preview_leads(apollo_url):
             
     # Apply Column Logic for Preview too (Clean up output)
     clean_leads = []
-    unwanted = {'account', 'account_id', 'awards', 'email', 'organization_id', 'breadcrumbs'}
     
     for lead in leads:
         new_lead = {}
@@ -303,42 +406,20 @@ def get_preview_leads(apollo_url):
         clean_leads.append(new_lead)
         
     return clean_leads
-    return clean_leads
 
-def save_leads_to_db(leads):
-    run_id = os.getenv("RUN_ID")
-    db_url = os.getenv("DATABASE_URL")
-    
-    if not run_id or not db_url:
-        print("Skipping DB Save: No RUN_ID or DATABASE_URL.")
-        return
+def get_preview_leads(apollo_url):
+    """
+    Fetches 10 leads, enriches them, and masks emails for preview.
+    (The API serves previews through backend.lead_preview; this is the CLI/sync path.)
+    """
+    leads = fetch_and_enrich_leads(apollo_url, limit=10, skip_enrichment=True)
+    return build_preview_rows(leads)
 
-    try:
-        print("Saving leads to database...")
-        engine = create_engine(db_url)
-        metadata = MetaData()
-        leads_table = Table('leads', metadata, autoload_with=engine)
-        
-        db_leads = []
+def save_leads_to_db(leads):
+    """Saves a finished list of leads in one go (run_orchestrator streams them instead)."""
+    with LeadWriter() as writer:
         for lead in leads:
-            db_leads.append({
-                "run_id": run_id,
-                "first_name": lead.get("first_name"),
-                "last_name": lead.get("last_name"),
-                "email": lead.get("blitz_email") or lead.get("email"),
-                "company": lead.get("organization", {}).get("name") or lead.get("company"),
-                "title": lead.get("title"),
-                "linkedin_url": lead.get("linkedin_url"),
-                "location": str(lead.get("country", "") or lead.get("state", "")),
-                "raw_data": lead
-            })
-            
-        with engine.connect() as conn:
-            conn.execute(insert(leads_table), db_leads)
-            conn.commit()
-        print(f"Successfully saved {len(db_leads)} leads to DB.")
-    except Exception as e:
-        print(f"DB Save Error: {e}")
+            writer.add(lead)
 def run_orchestrator(apollo_url, target_email, limit=100, mock_mode=False):
     # 1. Setup & Early Sheet Creation
     print(f"Starting Job for: {target_email} (Limit: {limit})")
@@ -390,6 +471,7 @@ def run_orchestrator(apollo_url, target_email, limit=100, mock_mode=False):
             worksheet.update([fieldnames])
             
             print(f"Sheet Created: {sheet_url}")
+            emit_result(sheet_url=sheet_url)
         
     except Exception as e:
         print(f"Sheet Creation Error: {e}")
@@ -399,16 +481,16 @@ def run_orchestrator(apollo_url, target_email, limit=100, mock_mode=False):
         eta_minutes = int(limit / 200) + 2 # Rough estimate
         send_email_notification(target_email, sheet_url, limit, status="STARTED", eta=eta_minutes)
 
-    # 3. Run Enrichment
-    enriched_leads = fetch_and_enrich_leads(apollo_url, limit, mock_mode=mock_mode)
+    # 3. Run Enrichment (4. leads are saved to the DB in chunks as they are verified)
+    with LeadWriter() as lead_writer, span("lead_gen.fetch_and_enrich", **{"lead.limit": limit}) as phase_span:
+        enriched_leads = fetch_and_enrich_leads(apollo_url, limit, mock_mode=mock_mode, on_verified=lead_writer.add)
+        phase_span.set("lead.count", len(enriched_leads))
+    emit_result(lead_count=len(enriched_leads), api_calls=sum(API_CALLS.values()))
     
     if not enriched_leads:
         print("No enriched leads found.")
         return
 
-    # 4. Save to DB
-    save_leads_to_db(enriched_leads)
-
     # 5. Populate Sheet
     if worksheet:
         try:
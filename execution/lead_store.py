@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+import os
+import threading
+
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, JSON, insert
+
+# Persists verified leads in chunks while a run is still enriching.
+# Postgres gets COPY ... FROM STDIN (one round trip per chunk, no per-row
+# INSERT parsing); anything else (local SQLite) gets an executemany INSERT.
+
+CHUNK_SIZE = int(os.getenv("LEAD_STORE_CHUNK_SIZE", "200"))
+
+# Mirror of backend.models.Lead, declared here so scripts don't have to
+# import the backend (and its engines) or reflect the table on every save.
+_metadata = MetaData()
+leads_table = Table(
+    "leads", _metadata,
+    Column("id", Integer, primary_key=True),
+    Column("run_id", String),
+    Column("first_name", String),
+    Column("last_name", String),
+    Column("email", String),
+    Column("company", String),
+    Column("title", String),
+    Column("linkedin_url", String),
+    Column("location", String),
+    Column("raw_data", JSON),
+)
+# Explicit NULL marker so empty strings stay empty strings (csv's default NULL is '')
+NULL_MARKER = "\\N"
+COPY_COLUMNS = ("run_id", "first_name", "last_name", "email", "company", "title", "linkedin_url", "location", "raw_data")
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(db_url):
+    """One engine per process and URL (the old save path built one per call)."""
+    if db_url.startswith("postgres://"):
+        db_url = "postgresql://" + db_url[len("postgres://"):]
+    with _engines_lock:
+        engine = _engines.get(db_url)
+        if engine is None:
+            engine = create_engine(db_url, pool_pre_ping=True)
+            _engines[db_url] = engine
+        return engine
+
+
+def lead_row(run_id, lead):
+    return {
+        "run_id": run_id,
+        "first_name": lead.get("first_name"),
+        "last_name": lead.get("last_name"),
+        "email": lead.get("blitz_email") or lead.get("email"),
+        "company": (lead.get("organization") or {}).get("name") or lead.get("company"),
+        "title": lead.get("title"),
+        "linkedin_url": lead.get("linkedin_url"),
+        "location": str(lead.get("country", "") or lead.get("state", "")),
+        "raw_data": lead,
+    }
+
+
+def _copy_rows(engine, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        values = []
+        for column in COPY_COLUMNS:
+            value = row[column]
+            if column == "raw_data":
+                value = json.dumps(value, default=str)
+            values.append(NULL_MARKER if value is None else value)
+        writer.writerow(values)
+    buffer.seek(0)
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.copy_expert(
+            f"COPY leads ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '{NULL_MARKER}')", buffer
+        )
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def save_lead_rows(engine, rows):
+    if not rows:
+        return
+    if engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2":
+        _copy_rows(engine, rows)
+    else:
+        with engine.begin() as conn:
+            conn.execute(insert(leads_table), rows)
+
+
+class LeadWriter:
+    """
+    Buffers verified leads and writes them every CHUNK_SIZE rows (and on
+    close). Leads whose email was already written for this run are skipped.
+    A no-op without RUN_ID / DATABASE_URL, like the old save path.
+    """
+
+    def __init__(self, run_id=None, db_url=None, chunk_size=CHUNK_SIZE):
+        self.run_id = run_id or os.getenv("RUN_ID")
+        self.db_url = db_url or os.getenv("DATABASE_URL")
+        self.chunk_size = chunk_size
+        self.enabled = bool(self.run_id and self.db_url)
+        self.saved = 0
+        self._buffer = []
+        self._seen_emails = set()
+        self._lock = threading.Lock()
+        if not self.enabled:
+            print("Skipping DB Save: No RUN_ID or DATABASE_URL.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def add(self, lead):
+        if not self.enabled:
+            return
+        row = lead_row(self.run_id, lead)
+        email = (row["email"] or "").strip().lower()
+        with self._lock:
+            if email:
+                if email in self._seen_emails:
+                    return
+                self._seen_emails.add(email)
+            self._buffer.append(row)
+            if len(self._buffer) < self.chunk_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._write(batch)
+
+    def close(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        self._write(batch)
+        if self.saved:
+            print(f"Successfully saved {self.saved} leads to DB.")
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            save_lead_rows(get_engine(self.db_url), batch)
+            with self._lock:
+                self.saved += len(batch)
+        except Exception as e:
+            print(f"DB Save Error ({len(batch)} leads): {e}")
@@ -2,7 +2,7 @@ import sqlite3
 import os
 import json
 from sqlalchemy.orm import Session
-from backend.database import SessionLocal, engine, Base
+from backend.database import SessionLocal, engine, Base, parse_legacy_timestamp
 from backend.models import Run, Log
 
 # Path to old DB
@@ -37,8 +37,8 @@ def migrate():
                 run_id=r['run_id'],
                 script_name=r['script_name'],
                 status=r['status'],
-                start_time=r['start_time'],
-                end_time=r['end_time'],
+                start_time=parse_legacy_timestamp(r['start_time']),
+                end_time=parse_legacy_timestamp(r['end_time']),
                 args=r['args'] if 'args' in r.keys() else "[]",
                 env_vars=r['env_vars'] if 'env_vars' in r.keys() else "{}"
             )